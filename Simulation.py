@@ -1,18 +1,23 @@
+import os
 import sys
+import threading
 import numpy as np
-import pyqtgraph as pg
-from PyQt5.QtCore import QCoreApplication, QThread, pyqtSignal, QTimer, Qt
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton, QComboBox, QLineEdit, QSizePolicy, QLabel
 from simgrid import SimGrid
 from solve_rk import Solver
+from warmup import startWarmup
+from profiling import profiler, rates
+from metrics import DivergenceMetrics
+from render import FrameBuffer
+
+# Get the kernels compiled (or loaded from the cache) while Qt is imported and the window is built
+warmup_thread = startWarmup(sparse=False)
 
-# Initial conditions
-INIT_POPSIZE = int(1e3)
-INIT_Z0 = int(10)
-INIT_INFECTION_GROWTH = 0.1
-INIT_HUMAN_LOSS = 0
-INIT_ZOMBIE_LOSS = 0.05
-INITGRIDSIZE = int(1e3)
+import pyqtgraph as pg
+from PyQt5.QtCore import QCoreApplication, QThread, pyqtSignal, QTimer, Qt
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton, QComboBox, QLineEdit, QSizePolicy, QLabel
+from timeseries import TimeSeriesStore
+from presets import (INIT_POPSIZE, INIT_Z0, INIT_INFECTION_GROWTH, INIT_HUMAN_LOSS, INIT_ZOMBIE_LOSS, INITGRIDSIZE,
+                     preset_values_eq, preset_values_init_pop)
 
 # Simulation speed settings
 speeds = [1, 2, 5, 10, 0.5, 0.1]
@@ -21,20 +26,6 @@ currentSpeedFactor = 1
 paused = False
 
 
-preset_values_eq = {
-    "Classic Apocalypse": {"a": INIT_INFECTION_GROWTH, "b": INIT_ZOMBIE_LOSS, "c": INIT_HUMAN_LOSS},
-    "Raging Outbreak": {"a": 0.2, "b": 0.02, "c": 0},
-    "Human Resistance": {"a": 0.02, "b": 0.1, "c": 0},
-    "Human Uprising": {"a": 0.02, "b": 0.5, "c": 0},
-    "Doomsday Virus": {"a": 1, "b": 0, "c": 0},
-}
-
-preset_values_init_pop = {
-    "Small Infection": {"pop": 1010, "z0": 10},
-    "Progressed Infection": {"pop": 1100, "z0": 100},
-    "One in a thousand": {"pop": 1000, "z0": 1},
-}
-
 def changePresetsEq(preset_name):
     values = preset_values_eq[preset_name]
     infection_growth_input.setText(str(values["a"]))
@@ -47,10 +38,6 @@ def changePresetsInitPop(preset_name):
     init_z0_input.setText(str(values["z0"]))
 
 
-# Create the initial helpers
-grid = SimGrid(INIT_POPSIZE, INIT_Z0, INIT_INFECTION_GROWTH, INIT_ZOMBIE_LOSS, INIT_HUMAN_LOSS, INITGRIDSIZE)
-solver = Solver(INIT_POPSIZE, INIT_Z0, INIT_INFECTION_GROWTH, INIT_ZOMBIE_LOSS, INIT_HUMAN_LOSS)
-
 # PyQtGraph setup
 app = QApplication(sys.argv)
 win = QMainWindow()
@@ -60,19 +47,22 @@ legend_label = QLabel("Green: Zombies | Blue: Humans")
 legend_label.setAlignment(Qt.AlignCenter)  # Center the text
 legend_label.setStyleSheet("font-size: 20px; font-weight: bold;")  # Make it more visible
 layout.addWidget(legend_label)  # Add it at the top of the layout
+divergence_label = QLabel()  # how far the grid is from the solver so far
+divergence_label.setAlignment(Qt.AlignCenter)
+layout.addWidget(divergence_label)
 central_widget.setLayout(layout)
 win.setCentralWidget(central_widget)
 
-# Grid visualization using ImageView
-grid_view = pg.ImageView()
-grid_view.ui.roiBtn.hide()  # Hides the ROI button
-grid_view.ui.menuBtn.hide()  # Hides the menu button
-grid_view.ui.histogram.hide()
+# Grid visualization, a plain view box holding one image the sim thread has already coloured (see render.py)
+grid_view = pg.GraphicsLayoutWidget()
+grid_box = grid_view.addViewBox(lockAspect=True, invertY=True)  # row 0 at the top
+grid_image = pg.ImageItem(axisOrder="row-major")
+grid_box.addItem(grid_image)
 
 # Define custom colormap
 custom_cmap = pg.ColorMap(pos=[0.0, 1.0],
                           color=[(0, 100, 0), (0, 0, 139)])
-grid_view.setColorMap(custom_cmap)
+grid_lut = custom_cmap.getLookupTable(0.0, 1.0, 256, alpha=True)
 grid_view.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 layout.addWidget(grid_view, stretch=2)
 
@@ -107,6 +97,8 @@ layout.addLayout(button_layout, stretch=0)
 pause_button = QPushButton("Pause")
 reset_button = QPushButton("Reset")
 speed_button = QPushButton("Speed x1")
+profile_button = QPushButton("Profiler")
+profile_button.setCheckable(True)
 constantPresetEq = QComboBox()
 constantPresetEq.addItems(preset_values_eq.keys())
 constantPresetEq.currentIndexChanged.connect(lambda event: changePresetsEq(constantPresetEq.currentText()))
@@ -116,6 +108,7 @@ constantPresetInitPop.currentIndexChanged.connect(lambda event: changePresetsIni
 button_layout.addWidget(pause_button)
 button_layout.addWidget(reset_button)
 button_layout.addWidget(speed_button)
+button_layout.addWidget(profile_button)
 button_layout.addWidget(constantPresetEq)
 button_layout.addWidget(constantPresetInitPop)
 
@@ -148,42 +141,124 @@ param_layout.addRow("Zombie Loss (c term in -cH)", zombie_loss_input)
 param_layout.addRow("Grid Size", grid_size_input)
 layout.addLayout(param_layout)
 
-# Simulation state variables
-time_stamps = []
-zombie_populations_sim = []
-human_populations_sim = []
-recovered_populations_sim = []
-zombie_populations_solver = []
-human_populations_solver = []
-recovered_populations_solver = []
+# Simulation state variables, plots only ever get about one point per pixel of the history
+series = TimeSeriesStore(["zombie_sim", "human_sim", "recovered_sim", "zombie_solver", "human_solver", "recovered_solver"])
+
+# The sim thread holds this while it steps, so the GUI never draws (or swaps out) a grid mid-step
+grid_lock = threading.Lock()
+# Set to wake the sim thread up when it is blocked on pause or a finished run
+sim_wakeup = threading.Event()
+APOCALYPSE_ATOI = 0.3  # a population this close to 0 counts as extinct
+steps_done = 0  # bumped by the sim thread after every step, lets the render timer skip frames with nothing new
+rendered_steps = -1
+RENDER_FPS = 30
+
+# The sim thread publishes a downsampled RGBA frame after every step, the GUI copies it into grid_frame and shows that
+frames = FrameBuffer(maxSide=800)
+grid_frame = None
+shown_frame = -1
+
+def publish_frame(grid):
+    """Colour the grid into the next frame, with a dynamic colormap range around 0. Called with grid_lock held"""
+    with profiler.phase("publish_frame"):
+        range_val = grid.popSize/(grid.squareSize*grid.squareSize)/5
+        frames.publish(grid.grid, -range_val, range_val, grid_lut)
 
 def update_grid():
-    """Update the grid image with a dynamic colormap range so that 0 maps to white."""
-    current_grid = grid.grid
-    range_val = grid.popSize/(grid.squareSize*grid.squareSize)/5
-
-    grid_view.setLevels(min=-range_val, max=range_val)
-    grid_view.setImage(current_grid.T, autoLevels=False)
+    """Show the latest published frame"""
+    global grid_frame, shown_frame
+    with profiler.phase("render_grid"):
+        shape = None if grid_frame is None else grid_frame.shape
+        grid_frame, frame_id = frames.readInto(grid_frame)
+        if grid_frame is None or frame_id == shown_frame:
+            return
+        shown_frame = frame_id
+        grid_image.setImage(grid_frame, autoLevels=False)
+        if grid_frame.shape != shape:
+            grid_box.autoRange()  # new grid size
+
+def newMetrics(grid, solver):
+    """Grid vs solver metrics starting from the current state of both"""
+    metrics = DivergenceMetrics(grid.popSize, atoi=APOCALYPSE_ATOI)
+    h_sol, z_sol, _ = solver.getPopulations(grid.timePassed)
+    metrics.update(grid.timePassed, grid.getHumanPopulation(), grid.getZombiePopulation(), h_sol, z_sol)
+    return metrics
+
+# Latest divergence numbers, published by whoever updates the metrics (with grid_lock held) under their own short lock,
+# so the render timer never waits on grid_lock while the sim thread steps
+divergence_lock = threading.Lock()
+divergence = None
+
+def publish_divergence(metrics):
+    """Snapshot of what the divergence label shows"""
+    global divergence
+    snapshot = (metrics.rmse(), metrics.maxDeviation(), metrics.zombiePeak("grid"), metrics.zombiePeak("solver"))
+    with divergence_lock:
+        divergence = snapshot
+
+def update_divergence():
+    with divergence_lock:
+        rmse, deviation, (grid_peak, grid_peak_t), (solver_peak, solver_peak_t) = divergence
+    divergence_label.setText(f"Grid vs solver RMSE H {rmse['human']:.1f} Z {rmse['zombie']:.1f} R {rmse['recovered']:.1f} | "
+                             f"max |dZ| {deviation['zombie'][0]:.1f} at t={deviation['zombie'][1]:g} | "
+                             f"zombie peak grid {grid_peak:.1f} at t={grid_peak_t:g}, solver {solver_peak:.1f} at t={solver_peak_t:g}")
 
 def update_sim_plot():
-    min_z_sim = min(len(time_stamps),len(zombie_populations_sim))
-    zombie_curve_sim.setData(time_stamps[:min_z_sim], zombie_populations_sim[:min_z_sim])
-    min_h_sim = min(len(time_stamps),len(human_populations_sim))
-    human_curve_sim.setData(time_stamps[:min_h_sim], human_populations_sim[:min_h_sim])
+    with profiler.phase("render_plots"):
+        points = max(plot_widget_sim.width(), 100)
+        zombie_curve_sim.setData(*series.getPlotData("zombie_sim", points))
+        human_curve_sim.setData(*series.getPlotData("human_sim", points))
 
 def update_solver_plot():
-    min_z_sol = min(len(time_stamps),len(zombie_populations_solver))
-    zombie_curve_solver.setData(time_stamps[:min_z_sol], zombie_populations_solver[:min_z_sol])
-    min_h_sol = min(len(time_stamps),len(human_populations_solver))
-    human_curve_solver.setData(time_stamps[:min_h_sol], human_populations_solver[:min_h_sol])
+    with profiler.phase("render_plots"):
+        points = max(plot_widget_solver.width(), 100)
+        zombie_curve_solver.setData(*series.getPlotData("zombie_solver", points))
+        human_curve_solver.setData(*series.getPlotData("human_solver", points))
+
+# Performance overlay in the corner of the grid, shows what happened since it was last refreshed
+profile_label = QLabel(grid_view)
+profile_label.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace; padding: 4px;")
+profile_label.move(8, 8)
+profile_label.hide()
+last_profile = profiler.snapshot()
+PROFILE_REFRESH_MS = 500
+
+def update_profile_overlay():
+    global last_profile
+    current = profiler.snapshot()
+    seconds, perCall, share, perSecond = rates(last_profile, current)
+    last_profile = current
+    lines = [f"{perSecond.get('frames', 0):.0f} FPS | {perSecond.get('steps', 0):.0f} steps/s | {perSecond.get('substeps', 0):.0f} substeps/s"]
+    for name in sorted(share, key=share.get, reverse=True):
+        lines.append(f"{name:<14}{perCall[name]:8.2f} ms {100 * share[name]:5.1f}%")
+    if perSecond.get("cells_visited"):
+        lines.append(f"{perSecond['cells_visited'] / 1e6:.1f}M cells/s | {perSecond.get('solver_blocks', 0):.1f} solver blocks/s")
+    profile_label.setText("\n".join(lines))
+    profile_label.adjustSize()
+
+def toggle_profiler(enabled):
+    global last_profile
+    if enabled:
+        profiler.reset()
+        last_profile = profiler.snapshot()
+        profiler.enable()
+        profile_label.setText("profiling...")
+        profile_label.adjustSize()
+        profile_label.show()
+        profile_timer.start(PROFILE_REFRESH_MS)
+    else:
+        profiler.disable()
+        profile_timer.stop()
+        profile_label.hide()
 
 def toggle_pause():
     global paused
     paused = not paused
     pause_button.setText("Play" if paused else "Pause")
+    sim_wakeup.set()
 
 def reset_simulation():
-    global grid, solver, time_stamps, zombie_populations_sim, human_populations_sim, zombie_populations_solver, human_populations_solver, recovered_populations_sim, recovered_populations_solver
+    global grid, solver, metrics
     global human_growth, human_loss, zombie_growth, zombie_loss, grid_size
     reset_button.setStyleSheet("")
     reset_button.setText("Reset")
@@ -193,19 +268,17 @@ def reset_simulation():
     # Reinitialize the grid with new parameters
     real_grid_size, _ = SimGrid.getNearestSquareCellCount(grid_size)
     grid_size_input.setText(str(real_grid_size))
-    grid = SimGrid(total_pop, init_z0, infection_growth, zombie_loss, human_loss, real_grid_size)
-    solver = Solver(total_pop, init_z0, infection_growth, zombie_loss, human_loss)
-    time_stamps.clear()
-    zombie_populations_sim.clear()
-    human_populations_sim.clear()
-    recovered_populations_sim.clear()
-    zombie_populations_solver.clear()
-    human_populations_solver.clear()
-    recovered_populations_solver.clear()
-    update_grid()
-    update_sim_plot()
-    update_solver_plot()
+    newGrid = SimGrid(total_pop, init_z0, infection_growth, zombie_loss, human_loss, real_grid_size)
+    newSolver = Solver(total_pop, init_z0, infection_growth, zombie_loss, human_loss)
+    newDivergence = newMetrics(newGrid, newSolver)
+    with grid_lock:
+        grid, solver, metrics = newGrid, newSolver, newDivergence
+        publish_frame(grid)
+        publish_divergence(metrics)
+        series.clear()
+    render(force=True)
     win.setWindowTitle("Zombie Simulation")
+    sim_wakeup.set()  # a finished run is waiting for exactly this
 
 def toggle_speed():
     global speed_idx, currentSpeedFactor
@@ -216,8 +289,23 @@ def toggle_speed():
 pause_button.clicked.connect(toggle_pause)
 reset_button.clicked.connect(reset_simulation)
 speed_button.clicked.connect(toggle_speed)
-
-SLEEPTIME = 10  # milliseconds for UI responsiveness
+profile_button.toggled.connect(toggle_profiler)
+
+# Milliseconds to wait between steps, 0 steps as fast as the grid allows. Drawing happens on its own timer either way,
+# set SIM_SLEEP_MS to slow the sim down to watch it
+SLEEPTIME = int(os.environ.get("SIM_SLEEP_MS") or 0)
+
+def render(force=False):
+    """Draw the latest state, called at RENDER_FPS no matter how fast the sim steps"""
+    global rendered_steps
+    if steps_done == rendered_steps and not force:
+        return
+    rendered_steps = steps_done
+    profiler.count("frames")
+    update_grid()
+    update_sim_plot()
+    update_solver_plot()
+    update_divergence()
 
 def saveAndMove():
     # Capture the current window and save it
@@ -281,78 +369,98 @@ def updateEquations():
     fullEquationHumans.setText(f"dH/dt = -{infection_growth}H*Z - {human_loss}*Z")
     fullEquationZombies.setText(f"dZ/dt = {infection_growth}H*Z - {zombie_loss}*H")
 
-def generalguiupdate():
+def inputsChanged():
+    # runs in the GUI thread whenever one of the inputs is edited
+    if updateInputs():
+        reset_button.setText("Restart Simulation to apply Changes")
     updateEquations()
 
+for param_input in (total_pop_input, init_z0_input, infection_growth_input, human_loss_input, zombie_loss_input, grid_size_input):
+    param_input.textChanged.connect(inputsChanged)
+
 class SimulationThread(QThread):
     triggerSaveAndMove = pyqtSignal()
-    dataChanged = pyqtSignal()
-    generalupdate = pyqtSignal()
+    finishedText = pyqtSignal(str)
+
+    def waitForWakeup(self):
+        """ Blocks until play or reset is pressed """
+        sim_wakeup.wait()
+        sim_wakeup.clear()
 
     def run(self):
-        global hitApoc
+        global hitApoc, steps_done
         hitApoc = False
-        self.generalupdate.emit()
         while True:
-            if updateInputs():
-                reset_button.setText("Restart Simulation to apply Changes")
-                self.generalupdate.emit()
-
             if paused:
+                self.waitForWakeup()
                 continue
-            atoi = 0.3
-            if grid.isApocalypse(atoi) and solver.isApocalypse(grid.timePassed,atoi):
+            atoi = APOCALYPSE_ATOI
+            with grid_lock:
+                finished = grid.isApocalypse(atoi) and solver.isApocalypse(grid.timePassed,atoi)
+                if finished and not hitApoc:
+                    finText = metrics.verdictText()
+                elif not finished:
+                    grid.propagate(currentSpeedFactor)
+                    publish_frame(grid)
+                    with profiler.phase("populations"):
+                        z_sim, h_sim, r_sim = grid.getZombiePopulation(), grid.getHumanPopulation(), grid.getRecoveredPopulation()
+
+                    # Solver computations if necessary
+                    with profiler.phase("solver"):
+                        h_sol, z_sol, r_sol = solver.getPopulations(grid.timePassed)
+                    with profiler.phase("record"):
+                        series.append(grid.timePassed, (z_sim, h_sim, r_sim, z_sol, h_sol, r_sol))
+                        metrics.update(grid.timePassed, h_sim, z_sim, h_sol, z_sol)
+                        publish_divergence(metrics)
+
+            if finished:
                 if not hitApoc:
-                    sim_humans_dead = np.isclose(grid.getHumanPopulation(),0,atol=atoi)
-                    solver_humans_dead = np.isclose(solver.getHumanPopulation(grid.timePassed),0,atol=atoi)
-                    if not sim_humans_dead and not solver_humans_dead:
-                        finText = "Uninamous Winner: Humans!"
-                    elif not sim_humans_dead:
-                        finText = "Grid thinks Humans, Solver thinks Zombies!"
-                    elif not solver_humans_dead:
-                        finText = "Grid thinks Zombies, Solver thinks Humans!"
-                    else:
-                        finText = "Uninamous Winner: Zombies :("
-
-                    reset_button.setText(f"{finText} | Restart")
+                    self.finishedText.emit(f"{finText} | Restart")
 
                     # uncomment this line if you want the simulation to screenshot this frame (pyqt window only!) and then move on to next preset config
                     # self.triggerSaveAndMove.emit()
-                    
+
                     hitApoc = True
+                # nothing left to step until a reset
+                self.waitForWakeup()
+                continue
             # also uncomment this if you want the same as above
-            # elif grid.timePassed > 50000:
-            #     finText = "Stagnated!"
-            #     reset_button.setText(f"{finText} | Restart")
+            # if grid.timePassed > 50000:
+            #     self.finishedText.emit("Stagnated! | Restart")
             #     self.triggerSaveAndMove.emit()
-            #     hitApoc = True
-            else:
-                if hitApoc:
-                    hitApoc = False
-                grid.propagate(currentSpeedFactor)
-                time_stamps.append(grid.timePassed)
-                z_sim, h_sim, r_sim = grid.getZombiePopulation(), grid.getHumanPopulation(), grid.getRecoveredPopulation()
-                zombie_populations_sim.append(z_sim)
-                human_populations_sim.append(h_sim)
-                recovered_populations_sim.append(r_sim)
-                
-                # Solver computations if necessary
-                z_sol, h_sol, r_sol = solver.getZombiePopulation(grid.timePassed), solver.getHumanPopulation(grid.timePassed), solver.getRecoveredPopulation(grid.timePassed) # Replace with real solver output
-                zombie_populations_solver.append(z_sol)
-                human_populations_solver.append(h_sol)
-                recovered_populations_solver.append(r_sol)
-                
-                self.dataChanged.emit()
-
-            self.msleep(SLEEPTIME)
+
+            hitApoc = False
+            steps_done += 1
+            profiler.count("steps")
+            if SLEEPTIME > 0:
+                self.msleep(SLEEPTIME)
+
+# Create the initial helpers, last so the warm up had the whole window build to get ahead
+grid = SimGrid(INIT_POPSIZE, INIT_Z0, INIT_INFECTION_GROWTH, INIT_ZOMBIE_LOSS, INIT_HUMAN_LOSS, INITGRIDSIZE)
+solver = Solver(INIT_POPSIZE, INIT_Z0, INIT_INFECTION_GROWTH, INIT_ZOMBIE_LOSS, INIT_HUMAN_LOSS)
+metrics = newMetrics(grid, solver)
+publish_frame(grid)
+publish_divergence(metrics)
 
 sim_thread = SimulationThread()
-sim_thread.dataChanged.connect(update_grid)
-sim_thread.dataChanged.connect(update_sim_plot)
-sim_thread.dataChanged.connect(update_solver_plot)
 sim_thread.triggerSaveAndMove.connect(saveAndMove)
-sim_thread.generalupdate.connect(generalguiupdate)
+sim_thread.finishedText.connect(reset_button.setText)
+updateEquations()
 sim_thread.start()
 
+render_timer = QTimer()
+render_timer.timeout.connect(render)
+render_timer.start(1000 // RENDER_FPS)
+profile_timer = QTimer()
+profile_timer.timeout.connect(update_profile_overlay)
+
+# SIM_PROFILE=<file>.json (or .csv) starts with the profiler on and writes what it measured there on exit
+profile_out = os.environ.get("SIM_PROFILE")
+if profile_out:
+    profile_button.setChecked(True)
+
 win.show()
-sys.exit(app.exec_())
\ No newline at end of file
+exit_code = app.exec_()
+if profile_out:
+    (profiler.toCSV if profile_out.endswith(".csv") else profiler.toJSON)(profile_out)
+sys.exit(exit_code)
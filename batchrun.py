@@ -0,0 +1,187 @@
+import argparse
+import csv
+import itertools
+import os
+import multiprocessing as mp
+import numpy as np
+from simgrid import SimGrid, BACKENDS
+from solve_rk import Solver
+from snapshots import SnapshotWriter
+from metrics import DivergenceMetrics, VERDICTS
+from presets import INITGRIDSIZE, preset_values_eq, preset_values_init_pop
+
+try:
+    import numba
+except ImportError:  # the numpy backend sweeps without it
+    numba = None
+
+# Headless sweep runner, no PyQt5/pyqtgraph needed. Every config runs SimGrid + Solver side by side
+# until both report an apocalypse (same rule as the GUI) or maxTime is hit.
+
+COLUMNS = ["time", "human_sim", "zombie_sim", "recovered_sim", "human_solver", "zombie_solver", "recovered_solver"]
+FORMATS = ("csv", "npz", "parquet")
+
+
+def buildConfigs(eqNames=None, popNames=None, gridSizes=(INITGRIDSIZE,), repeats=1, seed=None, **runOptions):
+    """ Cross product of equation presets x initial population presets x grid sizes x repeats.
+    With a seed, config i is seeded with seed + i so the whole sweep is reproducible """
+    eqNames = list(preset_values_eq) if eqNames is None else eqNames
+    popNames = list(preset_values_init_pop) if popNames is None else popNames
+    configs = []
+    for eqName, popName, gridSize, repeat in itertools.product(eqNames, popNames, gridSizes, range(repeats)):
+        eq = preset_values_eq[eqName]
+        initPop = preset_values_init_pop[popName]
+        name = f"{eqName}_{popName}"
+        if len(gridSizes) > 1:
+            name += f"_grid{gridSize}"
+        if repeats > 1:
+            name += f"_run{repeat}"
+        config = {"name": name, "pop": initPop["pop"], "z0": initPop["z0"],
+                  "a": eq["a"], "b": eq["b"], "c": eq["c"], "gridSize": gridSize,
+                  "seed": None if seed is None else seed + len(configs)}
+        config.update(runOptions)
+        configs.append(config)
+    return configs
+
+
+def runConfig(config, snapshotDir=None, metrics=None):
+    """ Run a single config to completion, returns (stopReason, trajectory array with COLUMNS).
+    With a snapshotDir and config["snapshotEvery"] set, every snapshotEvery-th grid is also streamed to disk.
+    A DivergenceMetrics passed in gets every step, recorded or not """
+    timeStep = config.get("timeStep", 1)
+    maxTime = config.get("maxTime", 50000)
+    atoi = config.get("atoi", 0.3)
+    recordEvery = config.get("recordEvery", 1)
+
+    grid = SimGrid(config["pop"], config["z0"], config["a"], config["b"], config["c"],
+                   config.get("gridSize", INITGRIDSIZE), config.get("moveProb", 0.05), seed=config.get("seed"),
+                   sparse=config.get("sparse", False), dtype=config.get("dtype", "float64"), backend=config.get("backend"))
+    solver = Solver(config["pop"], config["z0"], config["a"], config["b"], config["c"])
+
+    rows = []
+    def record():
+        t = grid.timePassed
+        rows.append((t, grid.getHumanPopulation(), grid.getZombiePopulation(), grid.getRecoveredPopulation(), *solver.getPopulations(t)))
+
+    def compare():
+        t = grid.timePassed
+        solverH, solverZ, _ = solver.getPopulations(t)
+        metrics.update(t, grid.getHumanPopulation(), grid.getZombiePopulation(), solverH, solverZ)
+
+    record()
+    if metrics is not None:
+        compare()
+    snapshotEvery = config.get("snapshotEvery")
+    writer = SnapshotWriter(snapshotDir, snapshotEvery) if snapshotDir and snapshotEvery else None
+    steps = 0
+    while True:
+        if grid.isApocalypse(atoi) and solver.isApocalypse(grid.timePassed, atoi):
+            stopReason = "apocalypse"
+            break
+        if grid.timePassed >= maxTime:
+            stopReason = "max_time"
+            break
+        grid.propagate(timeStep)
+        if writer is not None:
+            writer.record(grid)
+        steps += 1
+        if metrics is not None:
+            compare()
+        if steps % recordEvery == 0:
+            record()
+
+    if steps % recordEvery != 0:
+        record()  # always keep the final state
+    if writer is not None:
+        writer.close()
+    return stopReason, np.array(rows, dtype=np.float64)
+
+
+def writeTrajectory(path, trajectory, fmt):
+    if fmt == "csv":
+        np.savetxt(path + ".csv", trajectory, delimiter=",", fmt="%.10g", header=",".join(COLUMNS), comments="")
+    elif fmt == "npz":
+        np.savez_compressed(path + ".npz", **{col: trajectory[:, i] for i, col in enumerate(COLUMNS)})
+    elif fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet output needs pyarrow, install it or use csv/npz") from e
+        pq.write_table(pa.table({col: trajectory[:, i] for i, col in enumerate(COLUMNS)}), path + ".parquet")
+    else:
+        raise ValueError(f"Unknown output format {fmt}, expected one of {FORMATS}")
+
+
+def _runAndSave(job):
+    config, outDir, fmt = job
+    metrics = DivergenceMetrics(config["pop"], atoi=config.get("atoi", 0.3))
+    stopReason, trajectory = runConfig(config, os.path.join(outDir, config["name"] + "_snapshots"), metrics)
+    writeTrajectory(os.path.join(outDir, config["name"]), trajectory, fmt)
+    final = trajectory[-1]
+    summary = metrics.summary()
+    summary["verdict"] = VERDICTS[summary["verdict"]]
+    return {**config, "stopReason": stopReason, "steps": len(trajectory) - 1,
+            **{f"final_{col}": final[i] for i, col in enumerate(COLUMNS)}, **summary}
+
+
+def _initWorker(threads):
+    # every process gets its own kernels, so keep numba from oversubscribing the cores
+    if numba is not None:
+        numba.set_num_threads(threads)
+
+
+def runSweep(configs, outDir, fmt="csv", processes=None, threadsPerProcess=1):
+    """ Runs all configs over a process pool, writes one file per run plus summary.csv, returns the summary rows """
+    os.makedirs(outDir, exist_ok=True)
+    processes = processes or os.cpu_count()
+    jobs = [(config, outDir, fmt) for config in configs]
+
+    with mp.Pool(processes, initializer=_initWorker, initargs=(threadsPerProcess,)) as pool:
+        summary = list(pool.imap_unordered(_runAndSave, jobs))
+
+    order = {config["name"]: i for i, config in enumerate(configs)}
+    summary.sort(key=lambda row: order[row["name"]])
+    keys = list(summary[0].keys()) if summary else []
+    with open(os.path.join(outDir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=keys)  # quotes names and labels holding commas or quotes
+        writer.writeheader()
+        writer.writerows(summary)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless SimGrid + Solver preset sweep")
+    parser.add_argument("--eq", nargs="+", choices=list(preset_values_eq), help="equation presets (default: all)")
+    parser.add_argument("--pop", nargs="+", choices=list(preset_values_init_pop), help="initial population presets (default: all)")
+    parser.add_argument("--grid-size", nargs="+", type=int, default=[INITGRIDSIZE])
+    parser.add_argument("--repeats", type=int, default=1, help="stochastic replicas per config")
+    parser.add_argument("--time-step", type=float, default=1)
+    parser.add_argument("--max-time", type=float, default=50000, help="stop a run once this much time has passed")
+    parser.add_argument("--atoi", type=float, default=0.3, help="extinction tolerance")
+    parser.add_argument("--move-prob", type=float, default=0.05)
+    parser.add_argument("--sparse", action="store_true", help="only step occupied cells, much faster on big mostly empty grids")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64", help="grid precision")
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help="grid kernels (default: numba when it's installed)")
+    parser.add_argument("--seed", type=int, default=None, help="makes the sweep reproducible")
+    parser.add_argument("--record-every", type=int, default=1)
+    parser.add_argument("--snapshot-every", type=int, default=None, help="also stream every n-th grid to <out>/<run>_snapshots")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--processes", type=int, default=None, help="default: all cores")
+    parser.add_argument("--out", default="sweep_output")
+    args = parser.parse_args(argv)
+
+    configs = buildConfigs(args.eq, args.pop, args.grid_size, args.repeats, args.seed,
+                           timeStep=args.time_step, maxTime=args.max_time, atoi=args.atoi,
+                           moveProb=args.move_prob, sparse=args.sparse, dtype=args.dtype, backend=args.backend, recordEvery=args.record_every,
+                           snapshotEvery=args.snapshot_every)
+    summary = runSweep(configs, args.out, args.format, args.processes)
+    for row in summary:
+        print(f"{row['name']}: {row['stopReason']} at t={row['final_time']} "
+              f"(sim H={row['final_human_sim']:.1f} Z={row['final_zombie_sim']:.1f}, "
+              f"solver H={row['final_human_solver']:.1f} Z={row['final_zombie_solver']:.1f}, "
+              f"RMSE H={row['rmse_human']:.1f} Z={row['rmse_zombie']:.1f}) {row['verdict']}")
+
+
+if __name__ == "__main__":
+    main()
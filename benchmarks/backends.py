@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from simgrid import SimGrid, BACKENDS
+
+# numba vs numpy backend: what it costs to get the first step done in a fresh interpreter (numba with an empty and with
+# a filled cache), and the steady state time per step over grid sizes. Together they say which backend finishes a run
+# of n steps first
+
+FIRST_STEP = """
+import sys, time, json
+start = time.perf_counter()
+from simgrid import SimGrid
+grid = SimGrid(1000, 10, 0.1, 0.05, 0.0, 1000, seed=0, backend=sys.argv[1])
+grid.propagate(1)
+print(json.dumps({"first_step_s": time.perf_counter() - start}))
+"""
+
+POPULATIONS = {"dense": (1_000_000, 1000), "sparse": (1000, 10)}  # (population, initial zombies), sparse leaves most cells empty
+
+
+def firstStep(backend, cacheDir):
+    env = dict(os.environ, NUMBA_CACHE_DIR=cacheDir)
+    output = subprocess.run([sys.executable, "-c", FIRST_STEP, backend], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])["first_step_s"]
+
+
+def stepTime(backend, size, population, z0, minSeconds):
+    grid = SimGrid(population, z0, 0.1, 0.05, 0.0, size * size, seed=0, backend=backend)
+    grid.propagate(1)  # compiled (or loaded) before timing
+    steps, start = 0, time.perf_counter()
+    while steps < 3 or time.perf_counter() - start < minSeconds:
+        grid.propagate(1)
+        steps += 1
+    return (time.perf_counter() - start) / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the numba and numpy SimGrid backends")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[32, 100, 316, 1000], help="grid side lengths")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="time every case for at least this long")
+    parser.add_argument("--steps", nargs="+", type=int, default=[10, 100, 1000, 10000], help="run lengths to pick a backend for")
+    parser.add_argument("--out", default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    startup = {}
+    with tempfile.TemporaryDirectory() as cacheDir:
+        startup["numba_cold"] = firstStep("numba", cacheDir)
+        startup["numba_warm"] = firstStep("numba", cacheDir)  # the cold run filled the cache
+        startup["numpy"] = firstStep("numpy", cacheDir)
+    print("first step in a fresh interpreter: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in startup.items()))
+
+    results = []
+    print(f"{'cells':>9} {'population':>10} {'numba ms':>9} {'numpy ms':>9} {'ratio':>7}  fastest for " + "/".join(map(str, args.steps)) + " steps (warm, cold)")
+    for size in args.sizes:
+        for name, (population, z0) in POPULATIONS.items():
+            perStep = {backend: stepTime(backend, size, population, z0, args.min_seconds) for backend in BACKENDS}
+            fastest = {}
+            for cache in ("warm", "cold"):
+                setup = {"numba": startup[f"numba_{cache}"], "numpy": startup["numpy"]}
+                fastest[cache] = [min(BACKENDS, key=lambda backend: setup[backend] + steps * perStep[backend]) for steps in args.steps]
+            results.append({"cells": size * size, "population": name, "step_s": perStep, "fastest": fastest})
+            picks = " ".join(f"{warm}/{cold}" for warm, cold in zip(fastest["warm"], fastest["cold"]))
+            print(f"{size * size:>9} {name:>10} {perStep['numba'] * 1e3:>9.3f} {perStep['numpy'] * 1e3:>9.3f} "
+                  f"{perStep['numpy'] / perStep['numba']:>6.1f}x  {picks}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"startup_s": startup, "steps": args.steps, "results": results}, f, indent=2)
@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import numpy as np
+from numba import njit, prange
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import simNjits
+
+# Throughput of the stencil kernel vs the original list-of-tuples getNeighbors kernel, kept here only for comparison
+
+@njit
+def legacyShuffle(arr):
+    n = len(arr)
+    for i in range(n - 1, 0, -1):
+        j = np.random.randint(0, i + 1)
+        arr[i], arr[j] = arr[j], arr[i]
+    return arr
+
+@njit
+def legacyGetNeighbors(grid, row, col):
+    dxs = legacyShuffle(np.array([-1, 0, 1]))
+    dys = legacyShuffle(np.array([-1, 0, 1]))
+    neighbors = []
+    for dx in dxs:
+        for dy in dys:
+            if dx == 0 and dy == 0:
+                continue
+            newRow, newCol = row + dx, col + dy
+            if 0 <= newRow < grid.shape[0] and 0 <= newCol < grid.shape[1]:
+                neighbors.append((newRow, newCol))
+    return neighbors
+
+@njit
+def legacyInteractionsCELL(grid, row, col, changeGrid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir):
+    pop = grid[row, col]
+    if np.isclose(pop, 0):
+        return 0
+    cellPopAbs = abs(pop)
+    cellIsHumanDominated = pop > 0
+    cellLoss = humanLoss if cellIsHumanDominated else zombieLoss
+    cellGrowthDir = humanDir if cellIsHumanDominated else zombieDir
+    for neighborRow, neighborCol in legacyGetNeighbors(grid, row, col):
+        neighborPop = grid[neighborRow, neighborCol]
+        if np.isclose(neighborPop, 0) or cellIsHumanDominated == (neighborPop > 0):
+            continue
+        interactionAbs = min(cellPopAbs, abs(neighborPop))
+        change = interactionAbs * infectionGrowth * zombieDir
+        changeGrid[row, col] += change - min(interactionAbs * cellLoss * cellGrowthDir, cellPopAbs)
+
+@njit
+def legacyMovementCELL(grid, row, col, movementGrid, zombieDir, humanDir, moveProb):
+    cellPop = grid[row, col]
+    if np.isclose(cellPop, 0, atol=1e-3):
+        return
+    cellHumanDominated = cellPop > 0
+    cellGrowthDir = humanDir if cellHumanDominated else zombieDir
+    cellPopAbs = abs(cellPop)
+    for neighborRow, neighborCol in legacyGetNeighbors(grid, row, col):
+        if cellPopAbs <= 0:
+            break
+        if np.random.random() > moveProb:
+            continue
+        neighborPop = grid[neighborRow, neighborCol]
+        if np.isclose(neighborPop, 0, atol=1e-3) or cellHumanDominated == (neighborPop > 0):
+            amountLeaveAbs = np.random.uniform(0, cellPopAbs)
+            cellPopAbs -= amountLeaveAbs
+            movementGrid[neighborRow, neighborCol] += amountLeaveAbs * cellGrowthDir
+    movementGrid[row, col] += cellPopAbs * cellGrowthDir
+
+@njit(parallel=True)
+def legacyPropagate(grid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb):
+    changeGrid = np.zeros_like(grid)
+    movementGrid = np.zeros_like(grid)
+    rows, cols = grid.shape
+    for i in prange(rows * cols):
+        row, col = divmod(i, cols)
+        legacyInteractionsCELL(grid, int(row), int(col), changeGrid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir)
+    updatedGrid = grid + changeGrid * timeStep
+    for i in range(rows * cols):
+        row, col = divmod(i, cols)
+        legacyMovementCELL(updatedGrid, int(row), int(col), movementGrid, zombieDir, humanDir, moveProb)
+    return movementGrid
+
+
+def makeGrid(size, fill=0.5):
+    """ Fully mixed grid, fill is the fraction of non-empty cells so every cell walks its neighbours """
+    grid = np.random.uniform(1, 10, (size, size))
+    grid[np.random.random((size, size)) < 0.3] *= -1
+    grid[np.random.random((size, size)) > fill] = 0
+    return grid
+
+def timeKernel(fn, args, repeats):
+    fn(*args)  # compile / warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(*args)
+    return (time.perf_counter() - start) / repeats
+
+if __name__ == "__main__":
+    params = (1.0, 0.1, 0.05, 0.0, -1, 1, 0.05)
+    print(f"{'size':>6} {'legacy cells/s':>16} {'stencil cells/s':>16} {'torus cells/s':>16} {'speedup':>8}")
+    for size in (100, 300, 1000):
+        grid = makeGrid(size)
+        repeats = max(1, 2_000_000 // grid.size)
+        legacy = timeKernel(legacyPropagate, (grid,) + params, repeats)
+        buffers = (grid, np.empty_like(grid), np.empty_like(grid))
+        stencil = timeKernel(simNjits._propagateInto, buffers + params + (False, np.uint64(1), 0), repeats)
+        torus = timeKernel(simNjits._propagateInto, buffers + params + (True, np.uint64(1), 0), repeats)
+        print(f"{size:>6} {grid.size / legacy:>16.3e} {grid.size / stencil:>16.3e} {grid.size / torus:>16.3e} {legacy / stencil:>7.1f}x")
@@ -0,0 +1,41 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from simgrid import SimGrid
+from batchrun import buildConfigs, runConfig
+from presets import preset_values_eq
+
+# float32 vs float64 grids: same seed, same presets, how far apart do the trajectories end up and what does it buy
+
+def compareTrajectories(popName="Small Infection", gridSize=1000, seed=1, maxTime=2000):
+    print(f"{popName}, {gridSize} cells, seed {seed}")
+    print(f"{'preset':<20} {'max |dH|':>9} {'max |dZ|':>9} {'final H 64/32':>17} {'final Z 64/32':>17} {'same end':>9}")
+    for eqName in preset_values_eq:
+        results = {}
+        for dtype in ("float64", "float32"):
+            config = buildConfigs([eqName], [popName], (gridSize,), seed=seed, maxTime=maxTime, dtype=dtype)[0]
+            results[dtype] = runConfig(config)
+        (stop64, traj64), (stop32, traj32) = results["float64"], results["float32"]
+        steps = min(len(traj64), len(traj32))
+        dH = np.abs(traj64[:steps, 1] - traj32[:steps, 1]).max()
+        dZ = np.abs(traj64[:steps, 2] - traj32[:steps, 2]).max()
+        sameEnd = stop64 == stop32 and len(traj64) == len(traj32)
+        print(f"{eqName:<20} {dH:>9.2e} {dZ:>9.2e} {traj64[-1, 1]:>8.1f}/{traj32[-1, 1]:<8.1f} {traj64[-1, 2]:>8.1f}/{traj32[-1, 2]:<8.1f} {str(sameEnd):>9}")
+
+def compareSpeed(size=2000, steps=10):
+    print(f"\n{size}x{size} grid, Classic Apocalypse on a full grid")
+    for dtype in (np.float64, np.float32):
+        grid = SimGrid(size * size, size * size // 100, 0.1, 0.05, 0, size * size, seed=1, dtype=dtype)
+        grid.propagate(1)  # compile
+        start = time.perf_counter()
+        for _ in range(steps):
+            grid.propagate(1)
+        elapsed = (time.perf_counter() - start) / steps
+        print(f"{np.dtype(dtype).name:>8}: {elapsed * 1e3:8.1f} ms/step, {grid.grid.nbytes * 3 / 2**20:7.1f} MiB of grid buffers")
+
+if __name__ == "__main__":
+    compareTrajectories()
+    compareSpeed(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
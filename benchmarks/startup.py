@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold (empty numba cache) vs warm (cache filled by the cold run) startup, every measurement is a fresh interpreter
+
+LIBRARY = """
+import sys, time
+start = time.perf_counter()
+from simgrid import SimGrid
+from solve_rk import Solver
+imported = time.perf_counter()
+grid = SimGrid(1000, 10, 0.1, 0.05, 0, 1000)
+grid.propagate(1)
+Solver(1000, 10, 0.1, 0.05, 0).getPopulations(grid.timePassed)
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_step_s": done - imported, "total_s": done - start,
+                  "gui_imported": any(name.startswith(("PyQt5", "pyqtgraph")) for name in sys.modules)}))
+"""
+
+# Runs Simulation.py offscreen and reports once the first simulated step has been drawn
+GUI = """
+import time
+start = time.perf_counter()
+from PyQt5 import QtWidgets, QtCore
+def exec_(self):
+    def poll():
+        if g.get("rendered_steps", -1) > 0:
+            print(json.dumps({"first_frame_s": time.perf_counter() - start}))
+            os._exit(0)
+    timer = QtCore.QTimer()
+    timer.timeout.connect(poll)
+    timer.start(5)
+    return original()
+original = QtWidgets.QApplication.exec_
+QtWidgets.QApplication.exec_ = exec_
+g = {"__name__": "__main__"}
+exec(compile(open("Simulation.py").read(), "Simulation.py", "exec"), g)
+"""
+
+def runCase(code, cacheDir):
+    env = dict(os.environ, NUMBA_CACHE_DIR=cacheDir, QT_QPA_PLATFORM="offscreen")
+    output = subprocess.run([sys.executable, "-c", "import os, json\n" + code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    gui = "--gui" in sys.argv
+    results = {}
+    with tempfile.TemporaryDirectory() as cacheDir:
+        for name in ("cold", "warm"):
+            results[name] = {"library": runCase(LIBRARY, cacheDir)}
+        if gui:
+            # its own cache so the GUI cold start compiles too
+            with tempfile.TemporaryDirectory() as guiCacheDir:
+                for name in ("cold", "warm"):
+                    results[name]["gui"] = runCase(GUI, guiCacheDir)
+    print(json.dumps(results, indent=1))
@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numba
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import simNjits
+from simgrid import SimGrid
+from solve_rk import Solver
+
+# Benchmark matrix over the kernels, SimGrid and Solver. Results go to JSON so runs from different commits can be
+# compared with --compare, which exits non zero when something got slower than the tolerance allows
+
+PARAMS = (0.1, 0.05, 0.0)  # infectionGrowth, zombieLoss, humanLoss (Classic Apocalypse)
+
+def measure(fn, minTime=0.2, minRepeats=3):
+    """ Returns (first call seconds, mean, min, repeats). The first call includes any JIT compilation """
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+    times = []
+    while len(times) < minRepeats or sum(times) < minTime:
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return first, float(np.mean(times)), float(np.min(times)), len(times)
+
+
+class Suite:
+    def __init__(self, minTime):
+        self.minTime = minTime
+        self.results = []
+        self.compile = {}  # case name -> seconds spent compiling on its first call
+
+    def run(self, name, fn, work=None, **key):
+        first, mean, best, repeats = measure(fn, self.minTime)
+        if name not in self.compile:
+            self.compile[name] = max(first - mean, 0.0)
+        row = {"name": name, **key, "mean_s": mean, "min_s": best, "repeats": repeats}
+        if work:
+            row["items_per_s"] = work / mean
+        self.results.append(row)
+        print(f"{name:<24} {json.dumps(key):<72} {mean * 1e3:>10.3f} ms" + (f" {work / mean:>11.3e}/s" if work else ""))
+
+
+def gridCases(suite, size, density, timeSteps, threads):
+    population = max(int(density * size * size), 2)
+    grid = SimGrid(population, max(population // 100, 1), *PARAMS, size * size, seed=1)
+    cells = grid.grid.size
+    key = {"size": size, "population": population, "threads": threads}
+    seed = np.uint64(1)
+    outGrid, updatedGrid = np.empty_like(grid.grid), np.empty_like(grid.grid)
+    # the phase kernels _propagateInto runs, so these are the numbers of the production step split in two
+    suite.run("interaction", lambda: simNjits.interactionRows(grid.grid, outGrid, updatedGrid, 0, size, 1.0, *PARAMS, -1, 1, False, seed, 0),
+              cells, **key)
+    suite.run("movement", lambda: simNjits._propagateMovement(updatedGrid, outGrid, -1, 1, 0.05, False, seed, 0), cells, **key)
+    for timeStep in timeSteps:
+        stepKey = {**key, "timeStep": timeStep}
+        suite.run("simNjits.propagate", lambda: simNjits.propagate(grid.grid, timeStep, *PARAMS, -1, 1, 0.05, population,
+                                                                   SimGrid.MAXSTEPSIZE, False, seed, 0), cells, **stepKey)
+        for sparse in (False, True):
+            simGrid = SimGrid(population, max(population // 100, 1), *PARAMS, size * size, seed=1, sparse=sparse)
+            suite.run("SimGrid.propagate" + ("[sparse]" if sparse else ""), lambda: simGrid.propagate(timeStep), cells, **stepKey)
+
+    calls = 1000
+    def getters():
+        for _ in range(calls):
+            grid.getHumanPopulation()
+            grid.getZombiePopulation()
+            grid.getRecoveredPopulation()
+    suite.run("SimGrid getters", getters, 3 * calls, **key)
+
+
+def solverCases(suite):
+    calls = 1000
+    solver = Solver(1010, 10, *PARAMS)
+    solver.getPopulations(5000.0)  # integrated already, only lookups are timed
+    times = np.random.default_rng(1).uniform(0, 5000, calls)
+    def scalarLookups():
+        for t in times:
+            solver.getPopulations(t)
+    suite.run("Solver scalar lookup", scalarLookups, calls)
+    suite.run("Solver array lookup", lambda: solver.getPopulations(times), calls)
+    suite.run("Solver integrate", lambda: Solver(1010, 10, *PARAMS).getPopulations(5000.0))
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "numba": numba.__version__, "machine": platform.machine(), "cpus": os.cpu_count(),
+            "max_threads": numba.config.NUMBA_NUM_THREADS}
+
+
+def resultKey(row):
+    return json.dumps({k: v for k, v in row.items() if k not in ("mean_s", "min_s", "repeats", "items_per_s")}, sort_keys=True)
+
+
+def compare(baselinePath, results, tolerance):
+    """ Prints current/baseline time for every case present in both, returns the cases slower than 1 + tolerance """
+    with open(baselinePath) as f:
+        baseline = {resultKey(row): row for row in json.load(f)["results"]}
+    regressions = []
+    print(f"\nvs {baselinePath} (min time, >1 is slower)")
+    for row in results:
+        old = baseline.get(resultKey(row))
+        if old is None:
+            continue
+        ratio = row["min_s"] / old["min_s"]
+        flag = " REGRESSION" if ratio > 1 + tolerance else ""
+        print(f"{resultKey(row):<100} {ratio:>6.2f}{flag}")
+        if flag:
+            regressions.append(row)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation kernels, SimGrid and Solver")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 300, 1000], help="grid side lengths")
+    parser.add_argument("--densities", nargs="+", type=float, default=[0.01, 1.0], help="people per cell")
+    parser.add_argument("--time-steps", nargs="+", type=float, default=[1.0, 5.0])
+    parser.add_argument("--threads", nargs="+", type=int, default=None, help=f"numba thread counts (default: 1 and {numba.config.NUMBA_NUM_THREADS})")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to spend per case")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="slowdown allowed by --compare")
+    args = parser.parse_args(argv)
+
+    threadCounts = args.threads or sorted({1, numba.config.NUMBA_NUM_THREADS})
+    suite = Suite(args.min_time)
+    for threads in threadCounts:
+        numba.set_num_threads(threads)
+        for size in args.sizes:
+            for density in args.densities:
+                gridCases(suite, size, density, args.time_steps, threads)
+    solverCases(suite)
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": metadata(), "compile_s": suite.compile, "results": suite.results}, f, indent=1)
+    print("\ncompile time (s): " + ", ".join(f"{name} {seconds:.2f}" for name, seconds in suite.compile.items()))
+    print(f"results written to {args.out}")
+
+    if args.compare and compare(args.compare, suite.results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
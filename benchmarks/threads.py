@@ -0,0 +1,28 @@
+import os
+import sys
+import numba
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import simNjits
+from neighbors import makeGrid, timeKernel
+
+# Thread scaling of the interaction and movement phases, run with NUMBA_NUM_THREADS=<max threads to try>
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    grid = makeGrid(size)
+    updatedGrid = grid.copy()
+    movementGrid = np.zeros_like(grid)
+    params = (1.0, 0.1, 0.05, 0.0, -1, 1, 0.05)
+    repeats = max(1, 5_000_000 // grid.size)
+
+    print(f"grid {size}x{size}, up to {numba.config.NUMBA_NUM_THREADS} threads")
+    print(f"{'threads':>7} {'step ms':>9} {'movement ms':>12} {'step speedup':>13} {'movement speedup':>17}")
+    base = None
+    for threads in range(1, numba.config.NUMBA_NUM_THREADS + 1):
+        numba.set_num_threads(threads)
+        step = timeKernel(simNjits._propagateInto, (grid, movementGrid, updatedGrid) + params + (False, np.uint64(1), 0), repeats)
+        movement = timeKernel(simNjits._propagateMovement, (updatedGrid, movementGrid, -1, 1, 0.05, False, np.uint64(1), 0), repeats)
+        base = base or (step, movement)
+        print(f"{threads:>7} {step * 1e3:>9.2f} {movement * 1e3:>12.2f} {base[0] / step:>12.2f}x {base[1] / movement:>16.2f}x")
@@ -0,0 +1,121 @@
+import numpy as np
+
+# Initial placement of a population over the grid. A distribution turns (rng, count, shape) into how many people start
+# in every cell, SimGrid takes one for the humans and one for the zombies
+
+PLACE_CHUNK = 1 << 20  # cells added into the grid at a time when there are more people than cells
+
+
+def _checkWeights(weights):
+    weights = np.asarray(weights, dtype=np.float64).ravel()
+    if np.any(weights < 0) or not np.isfinite(weights).all() or weights.sum() <= 0:
+        raise ValueError("Distribution weights must be finite, non negative and not all zero")
+    return weights
+
+
+def _drawCells(rng, count, weights, cells):
+    """ The cell of every one of count people, for count < cells """
+    if weights is None:
+        return rng.integers(0, cells, count)
+    cumulative = np.cumsum(weights)
+    indices = np.searchsorted(cumulative, rng.random(count) * cumulative[-1], side="right")
+    return np.minimum(indices, cells - 1)
+
+
+def _multinomial(rng, count, weights, cells):
+    if weights is None:
+        return rng.multinomial(count, np.full(cells, 1 / cells))
+    return rng.multinomial(count, weights / weights.sum())
+
+
+def sampleCounts(rng, count, weights=None, shape=None):
+    """ count people spread over the cells with probability proportional to weights (uniform if None),
+    returns an int64 array of per cell counts. Cost is about min(count, cells), never one Python step per person """
+    shape = np.shape(weights) if weights is not None else shape
+    cells = int(np.prod(shape))
+    weights = None if weights is None else _checkWeights(weights)
+    if count < cells:
+        return np.bincount(_drawCells(rng, count, weights, cells), minlength=cells).reshape(shape)
+    return _multinomial(rng, count, weights, cells).reshape(shape)
+
+
+def placeInto(grid, rng, count, weights=None, direction=1, override=False):
+    """ Adds what sampleCounts would draw, times direction, straight into grid (any contiguous array, memmaps too) with
+    the same random draws. With override every cell that got anyone is set to direction instead.
+    Fewer people than cells are scattered one by one, so nothing grid sized is allocated for them """
+    flat = grid.reshape(-1)
+    if not np.shares_memory(flat, grid):
+        raise ValueError("placeInto needs a contiguous grid")
+    cells = flat.size
+    weights = None if weights is None else _checkWeights(weights)
+    if count < cells:
+        indices = _drawCells(rng, count, weights, cells)
+        if override:
+            flat[indices] = direction
+        else:
+            np.add.at(flat, indices, direction)
+        return
+    counts = _multinomial(rng, count, weights, cells)  # no bigger than the people themselves
+    for start in range(0, cells, PLACE_CHUNK):
+        chunk, chunkCounts = flat[start:start + PLACE_CHUNK], counts[start:start + PLACE_CHUNK]
+        if override:
+            chunk[chunkCounts > 0] = direction
+        else:
+            chunk += chunkCounts * direction
+
+
+class Distribution:
+    """ Base of the distributions below, a subclass only has to give the cell weights (None is uniform) """
+    def cellWeights(self, rng, shape):
+        return None
+
+    def sample(self, rng, count, shape):
+        """ Per cell counts, see sampleCounts """
+        weights = self.cellWeights(rng, shape)
+        return sampleCounts(rng, count, weights, None if weights is not None else shape)
+
+    def place(self, rng, count, grid, direction, override=False):
+        """ Adds count people into grid in place, see placeInto """
+        placeInto(grid, rng, count, self.cellWeights(rng, grid.shape), direction, override)
+
+
+class Uniform(Distribution):
+    """ Every cell is equally likely """
+
+
+class Hotspots(Distribution):
+    """ A few gaussian clusters at random places. radius is the cluster standard deviation as a fraction of the grid side,
+    background is the share of people placed uniformly instead """
+    def __init__(self, hotspots=3, radius=0.05, background=0.0):
+        self.hotspots = hotspots
+        self.radius = radius
+        self.background = background
+
+    def cellWeights(self, rng, shape):
+        rows, cols = shape
+        sigma = max(self.radius * max(rows, cols), 0.5)
+        centres = rng.random((self.hotspots, 2)) * (rows, cols)
+        strengths = rng.random(self.hotspots) + 0.5
+        rowIndex, colIndex = np.arange(rows), np.arange(cols)
+        weights = np.zeros(shape)
+        for (centreRow, centreCol), strength in zip(centres, strengths):
+            # a 2d gaussian is the outer product of two 1d ones, so each hotspot costs one pass over the grid
+            rowWeights = np.exp(-0.5 * ((rowIndex - centreRow) / sigma) ** 2)
+            colWeights = np.exp(-0.5 * ((colIndex - centreCol) / sigma) ** 2)
+            weights += strength * np.outer(rowWeights / rowWeights.sum(), colWeights / colWeights.sum())
+        weights /= weights.sum()
+        return (1 - self.background) * weights + self.background / weights.size
+
+
+class FromArray(Distribution):
+    """ Weights given per cell, e.g. a population density map. Resized by nearest neighbour if it doesn't match the grid """
+    def __init__(self, weights):
+        self.weights = np.asarray(weights, dtype=np.float64)
+
+    def cellWeights(self, rng, shape):
+        weights = self.weights
+        if weights.shape != tuple(shape):
+            rowIndex = np.arange(shape[0]) * weights.shape[0] // shape[0]
+            colIndex = np.arange(shape[1]) * weights.shape[1] // shape[1]
+            weights = weights[np.ix_(rowIndex, colIndex)]
+        return weights
@@ -0,0 +1,98 @@
+import numpy as np
+
+# Running comparison of SimGrid against Solver. Every update folds one sample of both models into a fixed set of
+# accumulators (squared error sums, maxima, peaks, extinction times), so a step costs the same however long the run has
+# been going and nothing is ever rescanned. Everything works elementwise on arrays, one entry per replica
+
+PENDING, HUMANS, ZOMBIES, GRID_HUMANS, GRID_ZOMBIES = -1, 0, 1, 2, 3
+VERDICTS = {PENDING: "Running", HUMANS: "Uninamous Winner: Humans!", ZOMBIES: "Uninamous Winner: Zombies :(",
+            GRID_HUMANS: "Grid thinks Humans, Solver thinks Zombies!", GRID_ZOMBIES: "Grid thinks Zombies, Solver thinks Humans!"}
+SERIES = ("human", "zombie", "recovered")
+
+
+class DivergenceMetrics:
+    """ Grid vs ODE divergence of H, Z and R, updated in O(1) per sample.
+    With replicas=None every value is a scalar, otherwise update() takes arrays of that length (the solver values may be
+    scalars, e.g. one Solver for an ensemble of grids) and every result has one entry per replica.
+    A model counts as extinct (and its run as decided) the first time humans or zombies are within atoi of 0 """
+    def __init__(self, populationSize, replicas=None, atoi=1e-3):
+        self.popSize = populationSize
+        self.atoi = atoi
+        self.shape = () if replicas is None else (replicas,)
+        self.samples = 0
+        self._sumSquares = np.zeros((3,) + self.shape)  # per series in SERIES
+        self._maxDeviation = np.zeros((3,) + self.shape)
+        self._maxDeviationTime = np.zeros((3,) + self.shape)
+        # per model, grid first: zombie peak height and time, extinction time and whether the humans were the ones to go
+        self._peak = np.full((2,) + self.shape, -np.inf)
+        self._peakTime = np.zeros((2,) + self.shape)
+        self._extinction = np.full((2,) + self.shape, np.nan)
+        self._humansDead = np.zeros((2,) + self.shape, dtype=bool)
+
+    def update(self, t, gridH, gridZ, solverH, solverZ):
+        """ Adds the populations of both models at time t """
+        gridH, gridZ, solverH, solverZ = np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in (gridH, gridZ, solverH, solverZ)))
+        dH, dZ = gridH - solverH, gridZ - solverZ
+        deviation = np.abs((dH, dZ, dH + dZ))  # R = pop - H - Z, so its error is -(dH + dZ)
+        self._sumSquares += deviation ** 2
+        larger = deviation > self._maxDeviation
+        self._maxDeviation[larger] = deviation[larger]
+        self._maxDeviationTime[larger] = t
+        self.samples += 1
+
+        zombies = np.stack((gridZ, solverZ))
+        higher = zombies > self._peak
+        self._peak[higher] = zombies[higher]
+        self._peakTime[higher] = t
+
+        humans = np.stack((gridH, solverH))
+        humansDead = np.abs(humans) <= self.atoi
+        ended = np.isnan(self._extinction) & (humansDead | (np.abs(zombies) <= self.atoi))
+        self._extinction[ended] = t
+        self._humansDead[ended] = humansDead[ended]
+
+    def _out(self, array):
+        return array.item() if array.ndim == 0 else array.copy()
+
+    def rmse(self):
+        """ {series: root mean squared grid - solver difference} over every sample so far """
+        values = np.sqrt(self._sumSquares / max(self.samples, 1))
+        return {name: self._out(values[i]) for i, name in enumerate(SERIES)}
+
+    def maxDeviation(self):
+        """ {series: (largest |grid - solver|, time it happened)} """
+        return {name: (self._out(self._maxDeviation[i]), self._out(self._maxDeviationTime[i])) for i, name in enumerate(SERIES)}
+
+    def zombiePeak(self, model="grid"):
+        """ (height, time) of the zombie peak so far of "grid" or "solver" """
+        i = 0 if model == "grid" else 1
+        return self._out(self._peak[i]), self._out(self._peakTime[i])
+
+    def extinctionTime(self, model="grid"):
+        """ Time humans or zombies of "grid" or "solver" were first within atoi of 0, nan while neither is """
+        return self._out(self._extinction[0 if model == "grid" else 1])
+
+    def verdict(self):
+        """ One of the verdict codes, PENDING until both models are extinct """
+        gridHumansDead, solverHumansDead = self._humansDead
+        codes = np.where(gridHumansDead, np.where(solverHumansDead, ZOMBIES, GRID_ZOMBIES), np.where(solverHumansDead, GRID_HUMANS, HUMANS))
+        codes = np.where(np.isnan(self._extinction).any(axis=0), PENDING, codes)
+        return self._out(codes)
+
+    def verdictText(self):
+        """ verdict() as the text the GUI shows, only for a single run """
+        return VERDICTS[self.verdict()]
+
+    def summary(self):
+        """ Everything above as one flat dict, ready for a csv row (scalars) or a table of replicas (arrays) """
+        summary = {"samples": self.samples}
+        for name, value in self.rmse().items():
+            summary[f"rmse_{name}"] = value
+        for name, (value, t) in self.maxDeviation().items():
+            summary[f"max_dev_{name}"] = value
+            summary[f"max_dev_{name}_time"] = t
+        for model in ("grid", "solver"):
+            summary[f"{model}_zombie_peak"], summary[f"{model}_zombie_peak_time"] = self.zombiePeak(model)
+            summary[f"{model}_extinction_time"] = self.extinctionTime(model)
+        summary["verdict"] = self.verdict()
+        return summary
@@ -0,0 +1,198 @@
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # no numba, everything below runs as plain Python: slower, but the Solver keeps working
+    prange = range
+
+    def njit(**options):
+        return lambda function: function
+
+# Dormand-Prince 5(4) coefficients, the same scheme scipy's RK45 uses
+C2, C3, C4, C5 = 1 / 5, 3 / 10, 4 / 5, 8 / 9
+A21 = 1 / 5
+A31, A32 = 3 / 40, 9 / 40
+A41, A42, A43 = 44 / 45, -56 / 15, 32 / 9
+A51, A52, A53, A54 = 19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729
+A61, A62, A63, A64, A65 = 9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656
+B1, B3, B4, B5, B6 = 35 / 384, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84
+# difference between the 5th and the embedded 4th order solution
+E1, E3, E4, E5, E6, E7 = 71 / 57600, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40
+
+MIN_FACTOR, MAX_FACTOR, SAFETY = 0.2, 10.0, 0.9
+
+@njit(cache=True)
+def clip(x, lo, hi):
+    """ Same as np.clip for scalars (hi wins if lo > hi) """
+    return min(max(x, lo), hi)
+
+@njit(cache=True)
+def model(H, Z, infectionGrowth, zombieLoss, humanLoss, interactionScale):
+    """ Differential equations for H and Z """
+    scaled_interaction = interactionScale * H * Z
+    dHdt = clip(-infectionGrowth * scaled_interaction - humanLoss * Z * interactionScale, -H, Z)
+    dZdt = clip(infectionGrowth * scaled_interaction - zombieLoss * H * interactionScale, -Z, H)
+    return dHdt, dZdt
+
+@njit(cache=True)
+def _errorNorm(eH, eZ, H, Z, newH, newZ, rtol, atol):
+    sH = atol + max(abs(H), abs(newH)) * rtol
+    sZ = atol + max(abs(Z), abs(newZ)) * rtol
+    return np.sqrt(((eH / sH) ** 2 + (eZ / sZ) ** 2) / 2)
+
+@njit(cache=True)
+def _initialStep(H, Z, dH, dZ, rtol, atol):
+    d0 = np.sqrt(((H / (atol + abs(H) * rtol)) ** 2 + (Z / (atol + abs(Z) * rtol)) ** 2) / 2)
+    d1 = np.sqrt(((dH / (atol + abs(H) * rtol)) ** 2 + (dZ / (atol + abs(Z) * rtol)) ** 2) / 2)
+    if d0 < 1e-5 or d1 < 1e-5:
+        return 1e-6
+    return 0.01 * d0 / d1
+
+@njit(cache=True)
+def dopriStep(H, Z, k1H, k1Z, h, infectionGrowth, zombieLoss, humanLoss, interactionScale, rtol, atol):
+    """ One Dormand-Prince step of size h, returns (newH, newZ, dH/dt, dZ/dt at the new point, error norm) """
+    k2H, k2Z = model(H + h * A21 * k1H, Z + h * A21 * k1Z, infectionGrowth, zombieLoss, humanLoss, interactionScale)
+    k3H, k3Z = model(H + h * (A31 * k1H + A32 * k2H), Z + h * (A31 * k1Z + A32 * k2Z), infectionGrowth, zombieLoss, humanLoss, interactionScale)
+    k4H, k4Z = model(H + h * (A41 * k1H + A42 * k2H + A43 * k3H), Z + h * (A41 * k1Z + A42 * k2Z + A43 * k3Z),
+                     infectionGrowth, zombieLoss, humanLoss, interactionScale)
+    k5H, k5Z = model(H + h * (A51 * k1H + A52 * k2H + A53 * k3H + A54 * k4H), Z + h * (A51 * k1Z + A52 * k2Z + A53 * k3Z + A54 * k4Z),
+                     infectionGrowth, zombieLoss, humanLoss, interactionScale)
+    k6H, k6Z = model(H + h * (A61 * k1H + A62 * k2H + A63 * k3H + A64 * k4H + A65 * k5H),
+                     Z + h * (A61 * k1Z + A62 * k2Z + A63 * k3Z + A64 * k4Z + A65 * k5Z),
+                     infectionGrowth, zombieLoss, humanLoss, interactionScale)
+    newH = H + h * (B1 * k1H + B3 * k3H + B4 * k4H + B5 * k5H + B6 * k6H)
+    newZ = Z + h * (B1 * k1Z + B3 * k3Z + B4 * k4Z + B5 * k5Z + B6 * k6Z)
+    k7H, k7Z = model(newH, newZ, infectionGrowth, zombieLoss, humanLoss, interactionScale)
+
+    eH = h * (E1 * k1H + E3 * k3H + E4 * k4H + E5 * k5H + E6 * k6H + E7 * k7H)
+    eZ = h * (E1 * k1Z + E3 * k3Z + E4 * k4Z + E5 * k5Z + E6 * k6Z + E7 * k7Z)
+    return newH, newZ, k7H, k7Z, _errorNorm(eH, eZ, H, Z, newH, newZ, rtol, atol)
+
+@njit(cache=True)
+def nextStep(h, step, err):
+    """ Step size to try after an accepted step of size h (step is what was asked for) """
+    factor = MAX_FACTOR if err == 0 else min(MAX_FACTOR, SAFETY * err ** -0.2)
+    if h == step or factor < 1:  # don't let a step shortened to hit the end grow from the short one
+        return h * factor
+    return step
+
+@njit(cache=True)
+def integrate(t0, H0, Z0, tEnd, step, infectionGrowth, zombieLoss, humanLoss, interactionScale, rtol, atol):
+    """ Adaptive Dormand-Prince from t0 to tEnd. step is the step size to try first (<= 0 picks one).
+    Returns the accepted nodes after t0 as (ts, ys, fs) with ys/fs of shape (n, 2), and the next step size to try """
+    capacity = 64
+    ts = np.empty(capacity)
+    ys = np.empty((capacity, 2))
+    fs = np.empty((capacity, 2))
+    count = 0
+
+    t, H, Z = t0, H0, Z0
+    k1H, k1Z = model(H, Z, infectionGrowth, zombieLoss, humanLoss, interactionScale)
+    if step <= 0:
+        step = _initialStep(H, Z, k1H, k1Z, rtol, atol)
+
+    while t < tEnd:
+        h = min(step, tEnd - t)
+        newH, newZ, k7H, k7Z, err = dopriStep(H, Z, k1H, k1Z, h, infectionGrowth, zombieLoss, humanLoss, interactionScale, rtol, atol)
+        if err > 1:  # reject and retry smaller
+            step = h * max(MIN_FACTOR, SAFETY * err ** -0.2)
+            continue
+
+        t, H, Z = t + h, newH, newZ
+        k1H, k1Z = k7H, k7Z  # first same as last
+        if count == capacity:
+            capacity *= 2
+            ts = np.concatenate((ts, np.empty(capacity - count)))
+            ys = np.concatenate((ys, np.empty((capacity - count, 2))))
+            fs = np.concatenate((fs, np.empty((capacity - count, 2))))
+        ts[count] = t
+        ys[count, 0], ys[count, 1] = H, Z
+        fs[count, 0], fs[count, 1] = k1H, k1Z
+        count += 1
+        step = nextStep(h, step, err)
+
+    return ts[:count], ys[:count], fs[:count], step
+
+@njit(cache=True)
+def hermiteScalar(t0, y0, f0, t1, y1, f1, t):
+    """ Cubic Hermite interpolation between (t0, y0, y0') and (t1, y1, y1') """
+    h = t1 - t0
+    s = (t - t0) / h
+    s2 = s * s
+    s3 = s2 * s
+    return (2 * s3 - 3 * s2 + 1) * y0 + (s3 - 2 * s2 + s) * h * f0 + (-2 * s3 + 3 * s2) * y1 + (s3 - s2) * h * f1
+
+@njit(cache=True)
+def hermite(ts, ys, fs, i, t, component):
+    """ Cubic Hermite interpolation of one component between node i and i + 1 """
+    return hermiteScalar(ts[i], ys[i, component], fs[i, component], ts[i + 1], ys[i + 1, component], fs[i + 1, component], t)
+
+@njit(cache=True)
+def denseValue(ts, ys, fs, count, t):
+    """ (H, Z) at time t from the first count nodes, binary search for the segment then Hermite interpolation """
+    if t <= ts[0]:
+        return ys[0, 0], ys[0, 1]
+    if t >= ts[count - 1]:
+        return ys[count - 1, 0], ys[count - 1, 1]
+    i = np.searchsorted(ts[:count], t, side="right") - 1
+    return hermite(ts, ys, fs, i, t, 0), hermite(ts, ys, fs, i, t, 1)
+
+@njit(cache=True)
+def denseValues(ts, ys, fs, count, queries):
+    """ denseValue for an array of times, returns an (n, 2) array of (H, Z) """
+    out = np.empty((len(queries), 2))
+    for q in range(len(queries)):
+        out[q, 0], out[q, 1] = denseValue(ts, ys, fs, count, queries[q])
+    return out
+
+@njit(cache=True)
+def extinctionTime(ts, ys, fs, count, atol):
+    """ First time H or Z drops to atol or below, -1 if that doesn't happen within the first count nodes """
+    if ys[0, 0] <= atol or ys[0, 1] <= atol:
+        return ts[0]
+    for i in range(count - 1):
+        if ys[i + 1, 0] <= atol or ys[i + 1, 1] <= atol:
+            lo, hi = ts[i], ts[i + 1]
+            for _ in range(50):  # bisect the interpolant inside the segment
+                mid = 0.5 * (lo + hi)
+                if hermite(ts, ys, fs, i, mid, 0) <= atol or hermite(ts, ys, fs, i, mid, 1) <= atol:
+                    hi = mid
+                else:
+                    lo = mid
+            return hi
+    return -1.0
+
+@njit(parallel=True, cache=True)
+def integrateBatch(populationSizes, z0s, infectionGrowths, zombieLosses, humanLosses, times, rtol, atol):
+    """ Integrates every parameter set in parallel and samples it at the sorted times,
+    returns an (n_params, n_times, 2) array of (H, Z). Only the current step is kept, no node history """
+    n = len(populationSizes)
+    out = np.empty((n, len(times), 2))
+    for p in prange(n):
+        infectionGrowth, zombieLoss, humanLoss = infectionGrowths[p], zombieLosses[p], humanLosses[p]
+        interactionScale = 1 / populationSizes[p]
+        t, H, Z = 0.0, populationSizes[p] - z0s[p], z0s[p]
+        k1H, k1Z = model(H, Z, infectionGrowth, zombieLoss, humanLoss, interactionScale)
+        step = _initialStep(H, Z, k1H, k1Z, rtol, atol)
+
+        q = 0
+        while q < len(times) and times[q] <= t:
+            out[p, q, 0], out[p, q, 1] = H, Z
+            q += 1
+
+        while q < len(times):
+            h = min(step, times[-1] - t)
+            newH, newZ, k7H, k7Z, err = dopriStep(H, Z, k1H, k1Z, h, infectionGrowth, zombieLoss, humanLoss, interactionScale, rtol, atol)
+            if err > 1:
+                step = h * max(MIN_FACTOR, SAFETY * err ** -0.2)
+                continue
+
+            newT = t + h
+            while q < len(times) and times[q] <= newT:
+                out[p, q, 0] = hermiteScalar(t, H, k1H, newT, newH, k7H, times[q])
+                out[p, q, 1] = hermiteScalar(t, Z, k1Z, newT, newZ, k7Z, times[q])
+                q += 1
+            t, H, Z = newT, newH, newZ
+            k1H, k1Z = k7H, k7Z
+            step = nextStep(h, step, err)
+    return out
@@ -0,0 +1,23 @@
+# Shared initial conditions and presets, kept free of any GUI imports so headless runs can use them
+
+# Initial conditions
+INIT_POPSIZE = int(1e3)
+INIT_Z0 = int(10)
+INIT_INFECTION_GROWTH = 0.1
+INIT_HUMAN_LOSS = 0
+INIT_ZOMBIE_LOSS = 0.05
+INITGRIDSIZE = int(1e3)
+
+preset_values_eq = {
+    "Classic Apocalypse": {"a": INIT_INFECTION_GROWTH, "b": INIT_ZOMBIE_LOSS, "c": INIT_HUMAN_LOSS},
+    "Raging Outbreak": {"a": 0.2, "b": 0.02, "c": 0},
+    "Human Resistance": {"a": 0.02, "b": 0.1, "c": 0},
+    "Human Uprising": {"a": 0.02, "b": 0.5, "c": 0},
+    "Doomsday Virus": {"a": 1, "b": 0, "c": 0},
+}
+
+preset_values_init_pop = {
+    "Small Infection": {"pop": 1010, "z0": 10},
+    "Progressed Infection": {"pop": 1100, "z0": 100},
+    "One in a thousand": {"pop": 1000, "z0": 1},
+}
@@ -0,0 +1,110 @@
+import csv
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+# Per phase timings and counters for the sim and the GUI. Everything goes through the module level `profiler`, which is
+# off by default: then phase() hands out one shared do-nothing context and count() returns straight away, so the hooks
+# can stay in the hot paths. Turn it on with profiler.enable() (or the Profiler button in Simulation.py)
+
+_NOTHING = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    """ Accumulates (calls, total seconds, max seconds) per phase and totals per counter, safe to use from several threads """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._phases = {}  # name -> [calls, total, max]
+            self._counters = {}
+            self._started = time.perf_counter()
+
+    def phase(self, name):
+        """ Context manager timing everything inside it as one call of phase name """
+        if not self.enabled:
+            return _NOTHING
+        return _Phase(self, name)
+
+    def record(self, name, seconds):
+        """ Adds one call of phase name that took seconds, for timings taken elsewhere """
+        with self._lock:
+            entry = self._phases.get(name)
+            if entry is None:
+                self._phases[name] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """ Copy of everything so far: {"elapsed": seconds since reset, "phases": {name: {"calls", "total", "max"}}, "counters": {...}} """
+        with self._lock:
+            return {"elapsed": time.perf_counter() - self._started,
+                    "phases": {name: {"calls": calls, "total": total, "max": longest} for name, (calls, total, longest) in self._phases.items()},
+                    "counters": dict(self._counters)}
+
+    def toJSON(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def toCSV(self, path):
+        """ One row per phase (calls, total and mean/max milliseconds) and one per counter (value in calls) """
+        snapshot = self.snapshot()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["kind", "name", "calls", "total_s", "mean_ms", "max_ms"])
+            for name, phase in sorted(snapshot["phases"].items()):
+                writer.writerow(["phase", name, phase["calls"], f"{phase['total']:.6f}",
+                                 f"{1000 * phase['total'] / phase['calls']:.4f}", f"{1000 * phase['max']:.4f}"])
+            for name, value in sorted(snapshot["counters"].items()):
+                writer.writerow(["counter", name, value, "", "", ""])
+
+
+def rates(before, after):
+    """ What happened between two snapshots: (seconds, {phase: ms per call}, {phase: share of the wall time}, {counter: per second}) """
+    seconds = max(after["elapsed"] - before["elapsed"], 1e-9)
+    perCall, share = {}, {}
+    for name, phase in after["phases"].items():
+        old = before["phases"].get(name, {"calls": 0, "total": 0.0})
+        calls = phase["calls"] - old["calls"]
+        if calls:
+            total = phase["total"] - old["total"]
+            perCall[name] = 1000 * total / calls
+            share[name] = total / seconds
+    perSecond = {name: (value - before["counters"].get(name, 0)) / seconds for name, value in after["counters"].items()}
+    return seconds, perCall, share, perSecond
+
+
+profiler = Profiler()
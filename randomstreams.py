@@ -0,0 +1,26 @@
+import numpy as np
+
+# The stencil order table and the counter based random streams both backends share, so simNjits and simNumpy make the
+# same decision for every cell. No numba in here, simNjits compiles mix64 itself.
+# simNjits bakes these values into its cached kernels and numba only watches simNjits.py for changes, so after editing
+# anything here delete the simNjits*.nbi/.nbc files in __pycache__ or the old values keep being used
+
+# Visiting order of the 3x3 stencil: the row offsets and the column offsets are each put in a random order
+# (what shuffling [-1, 0, 1] twice gave us), so a cell only needs two random indices into this table
+PERMUTATIONS3 = np.array([[0, 1, 2], [0, 2, 1], [1, 0, 2], [1, 2, 0], [2, 0, 1], [2, 1, 0]], dtype=np.int64)
+NEIGHBOR_SLOTS = 9  # 3x3 block, the centre slot is skipped
+
+# Counter based random numbers: every (seed, step, phase, cell) has its own stream and draw k of a stream is a hash
+# of the stream key and k. Results don't depend on which thread runs a cell or in what order, so runs are reproducible
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX2 = np.uint64(0x94D049BB133111EB)
+INTERACTION_PHASE = 0
+MOVEMENT_PHASE = 1
+
+
+def mix64(x):
+    """ splitmix64 finaliser, elementwise on a uint64 array or on one uint64 """
+    x = (x ^ (x >> np.uint64(30))) * MIX1
+    x = (x ^ (x >> np.uint64(27))) * MIX2
+    return x ^ (x >> np.uint64(31))
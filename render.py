@@ -0,0 +1,75 @@
+import math
+import threading
+import numpy as np
+from numba import njit, prange
+
+# Drawing path for big grids: the sim thread turns the grid into a small RGBA frame (block means of the cells mapped
+# through a colour lookup table) and the GUI only ever copies that frame into an array it keeps reusing. The frame is at
+# most maxSide pixels a side, so drawing costs the same however big the grid gets, and the GUI never reads the grid
+# itself while the sim thread steps it
+
+@njit(parallel=True, cache=True)
+def downsampleRGBA(grid, factor, low, high, lut, out):
+    """ Means of factor x factor blocks of grid, low..high mapped onto the rows of lut (n x 4 uint8), written into
+    out of shape (blocks down, blocks across, 4). Row-major RGBA uint8 is what a QImage can wrap without a copy """
+    rows, cols = grid.shape
+    outRows, outCols = out.shape[0], out.shape[1]
+    scale = (lut.shape[0] - 1) / (high - low) if high > low else 0.0
+    for i in prange(outRows):
+        blockRow = np.int64(i)
+        rowStart = blockRow * factor
+        rowEnd = min(rowStart + factor, rows)
+        for blockCol in range(outCols):
+            colStart = blockCol * factor
+            colEnd = min(colStart + factor, cols)
+            total = 0.0
+            for row in range(rowStart, rowEnd):
+                for col in range(colStart, colEnd):
+                    total += grid[row, col]
+            mean = total / ((rowEnd - rowStart) * (colEnd - colStart))
+            index = min(max(int((mean - low) * scale + 0.5), 0), lut.shape[0] - 1)
+            for channel in range(4):
+                out[blockRow, blockCol, channel] = lut[index, channel]
+
+
+class FrameBuffer:
+    """ Double buffered RGBA frames of a grid. publish() draws into the back frame and swaps, readInto() copies the
+    front one out, both can be called from any thread. Frames are only reallocated when the grid size changes """
+    def __init__(self, maxSide=800):
+        self.maxSide = maxSide
+        self.frameId = 0  # bumped by every publish
+        self._frames = None
+        self._front = 0
+        self._swapLock = threading.Lock()  # held for swapping and copying out, never while drawing
+        self._publishLock = threading.Lock()  # one publisher at a time (the sim thread, and the GUI on a reset)
+
+    def frameShape(self, gridShape):
+        """ (blocks down, blocks across, 4) and the block size for a grid of gridShape """
+        factor = max(1, math.ceil(max(gridShape) / self.maxSide))
+        return (math.ceil(gridShape[0] / factor), math.ceil(gridShape[1] / factor), 4), factor
+
+    def publish(self, grid, low, high, lut):
+        """ Draws grid with values low..high spread over lut and makes it the front frame """
+        shape, factor = self.frameShape(grid.shape)
+        with self._publishLock:
+            if self._frames is None or self._frames[0].shape != shape:
+                frames = [np.zeros(shape, dtype=np.uint8) for _ in range(2)]
+                with self._swapLock:
+                    self._frames, self._front = frames, 0
+            back = self._frames[1 - self._front]
+            downsampleRGBA(grid, factor, float(low), float(high), lut, back)
+            with self._swapLock:
+                self._front = 1 - self._front
+                self.frameId += 1
+
+    def readInto(self, out=None):
+        """ Copies the front frame into out, returns (out, frameId). out is only (re)allocated when it is missing or the
+        wrong size, and None comes back while nothing was published yet """
+        with self._swapLock:
+            if self._frames is None:
+                return None, self.frameId
+            front = self._frames[self._front]
+            if out is None or out.shape != front.shape:
+                out = np.empty_like(front)
+            np.copyto(out, front)
+            return out, self.frameId
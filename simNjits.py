@@ -1,34 +1,44 @@
 import numpy as np
-import numba
 from numba import njit, prange
-from numba.typed import Dict
-from numba.core import types
-
-@njit
-def shuffle_array(arr):
-    """ Fisher-Yates shuffle implementation for Numba """
-    n = len(arr)
-    for i in range(n - 1, 0, -1):
-        j = np.random.randint(0, i + 1)
-        arr[i], arr[j] = arr[j], arr[i]
-    return arr
-
-@njit
-def getNeighbors(grid, row, col):
-    dxs = shuffle_array(np.array([-1, 0, 1]))
-    dys = shuffle_array(np.array([-1, 0, 1]))
-    neighbors = []
-    for dx in dxs:
-        for dy in dys:
-            if dx == 0 and dy == 0:
-                continue
-            newRow, newCol = row + dx, col + dy
-            if 0 <= newRow < grid.shape[0] and 0 <= newCol < grid.shape[1]:
-                neighbors.append((newRow, newCol))
-    return neighbors
-
-@njit
-def propagateInteractionsCELL(grid, row, col, changeGrid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir):
+
+import randomstreams
+from randomstreams import PERMUTATIONS3, NEIGHBOR_SLOTS, GOLDEN, INTERACTION_PHASE, MOVEMENT_PHASE
+
+# The stencil order table, the random stream constants and the splitmix64 finaliser come from randomstreams, shared with
+# simNumpy. Numba reads the constants as compile time globals of the functions below
+mix64 = njit(cache=True)(randomstreams.mix64)
+
+@njit(cache=True)
+def cellStream(seed, step, phase, cell):
+    key = mix64(seed + np.uint64(step) * GOLDEN)
+    key = mix64(key + np.uint64(phase) * GOLDEN)
+    return mix64(key + np.uint64(cell) * GOLDEN)
+
+@njit(cache=True)
+def randomUniform(stream, draw):
+    """ The draw-th uniform [0, 1) number of a stream """
+    return (mix64(stream + np.uint64(draw + 1) * GOLDEN) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+@njit(cache=True)
+def randomNeighborOrder(stream):
+    """ Uses draws 0 and 1 of the stream """
+    return int(randomUniform(stream, 0) * 6), int(randomUniform(stream, 1) * 6)
+
+@njit(cache=True)
+def getNeighbor(slot, rowOrder, colOrder, row, col, rows, cols, periodic):
+    """ Neighbour number slot (0-8) in the given visiting order, returns (row, col, valid) without allocating """
+    dx = PERMUTATIONS3[rowOrder, slot // 3] - 1
+    dy = PERMUTATIONS3[colOrder, slot % 3] - 1
+    if dx == 0 and dy == 0:
+        return row, col, False
+    newRow, newCol = row + dx, col + dy
+    if periodic:
+        return newRow % rows, newCol % cols, True
+    return newRow, newCol, 0 <= newRow < rows and 0 <= newCol < cols
+
+@njit(cache=True)
+def propagateInteractionsCELL(grid, row, col, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, stream):
+    """ Returns the change of this cell per unit of time """
     pop = grid[row, col]
     if np.isclose(pop, 0):
         return 0 # Skip empty cells
@@ -38,9 +48,15 @@ def propagateInteractionsCELL(grid, row, col, changeGrid, infectionGrowth, zombi
     cellLoss = humanLoss if cellIsHumanDominated else zombieLoss
     cellGrowthDir = humanDir if cellIsHumanDominated else zombieDir
 
-    neighbors = getNeighbors(grid, row, col)
+    rows, cols = grid.shape
+    rowOrder, colOrder = randomNeighborOrder(stream)
+    totalChange = 0.0
+
+    for slot in range(NEIGHBOR_SLOTS):
+        neighborRow, neighborCol, valid = getNeighbor(slot, rowOrder, colOrder, row, col, rows, cols, periodic)
+        if not valid:
+            continue
 
-    for neighborRow, neighborCol in neighbors:    
         neighborPop = grid[neighborRow, neighborCol]
         neighborHumanDominated = neighborPop > 0
         isInteraction = cellIsHumanDominated != neighborHumanDominated  # Must be opposite types
@@ -58,12 +74,14 @@ def propagateInteractionsCELL(grid, row, col, changeGrid, infectionGrowth, zombi
         cellChangeLoss = min(interactionAbs * cellLoss * cellGrowthDir,cellPopAbs)
         cellChange = change - cellChangeLoss 
 
-        changeGrid[row, col] += cellChange
+        totalChange += cellChange
         # changeGrid[neighborRow, neighborCol] += neighborChange
 
+    return totalChange
 
-@njit
-def propagateMovementCELL(grid, row, col, movementGrid, zombieDir, humanDir, moveProb):
+
+@njit(cache=True)
+def propagateMovementCELL(grid, row, col, movementGrid, zombieDir, humanDir, moveProb, periodic, stream):
     cellPop = grid[row, col]
     if np.isclose(cellPop,0,atol=1e-3):
         return
@@ -71,13 +89,21 @@ def propagateMovementCELL(grid, row, col, movementGrid, zombieDir, humanDir, mov
     cellHumanDominated = cellPop > 0
     cellGrowthDir = humanDir if cellHumanDominated else zombieDir
     cellPopAbs = abs(cellPop)
-    neighbors = getNeighbors(grid, row, col)
+    rows, cols = grid.shape
+    rowOrder, colOrder = randomNeighborOrder(stream)
+    draw = 2
+
+    for slot in range(NEIGHBOR_SLOTS):
+        neighborRow, neighborCol, valid = getNeighbor(slot, rowOrder, colOrder, row, col, rows, cols, periodic)
+        if not valid:
+            continue
 
-    for neighborRow, neighborCol in neighbors:
         if cellPopAbs <= 0:
             break  # Used all growth already
 
-        if np.random.random() > moveProb:
+        lucky = randomUniform(stream, draw) <= moveProb
+        draw += 1
+        if not lucky:
             continue  # Skip movement if not lucky
 
         neighborPop = grid[neighborRow, neighborCol]
@@ -85,46 +111,464 @@ def propagateMovementCELL(grid, row, col, movementGrid, zombieDir, humanDir, mov
         isInteraction = cellHumanDominated != neigborHumanDominated
 
         if np.isclose(neighborPop,0,atol=1e-3) or not isInteraction:
-            amountLeaveAbs = np.random.uniform(0, cellPopAbs)
+            amountLeaveAbs = randomUniform(stream, draw) * cellPopAbs
+            draw += 1
             cellPopAbs -= amountLeaveAbs
 
             movementGrid[neighborRow, neighborCol] += amountLeaveAbs * cellGrowthDir
 
     movementGrid[row, col] += cellPopAbs * cellGrowthDir
 
-@njit(parallel=True)
-def _propagate(grid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, totalPop):
-    changeGrid = np.zeros_like(grid, dtype=np.float64)
-    movementGrid = np.zeros_like(grid, dtype=np.float64)
-    
-    rows, cols = grid.shape
+@njit(cache=True)
+def movementRowsColoured(rows, periodic):
+    """ Movement scatters into the rows above and below, so rows are coloured by row % 3 and rows of one colour never
+    write to the same cell. On a torus the last rows % 3 rows would wrap onto the first colour, those run serially """
+    return rows - rows % 3 if periodic else rows
 
-    for i in prange(rows * cols):  # Single prange over all elements
-        row, col = divmod(i, cols)
-        propagateInteractionsCELL(grid, int(row), int(col), changeGrid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir)
-    
-    changeTimeScaled = changeGrid * timeStep
-    updatedGrid = np.add(grid, changeTimeScaled)
+@njit(parallel=True, cache=True)
+def _propagateMovement(updatedGrid, movementGrid, zombieDir, humanDir, moveProb, periodic, seed, step):
+    rows, cols = updatedGrid.shape
+    colouredRows = movementRowsColoured(rows, periodic)
+
+    for colour in range(3):
+        for i in prange((colouredRows - colour + 2) // 3):  # every row of this colour in parallel
+            row = colour + 3 * i
+            for col in range(cols):
+                stream = cellStream(seed, step, MOVEMENT_PHASE, row * cols + col)
+                propagateMovementCELL(updatedGrid, row, col, movementGrid, zombieDir, humanDir, moveProb, periodic, stream)
+
+    for row in range(colouredRows, rows):
+        for col in range(cols):
+            stream = cellStream(seed, step, MOVEMENT_PHASE, row * cols + col)
+            propagateMovementCELL(updatedGrid, row, col, movementGrid, zombieDir, humanDir, moveProb, periodic, stream)
+
+@njit(cache=True)
+def _propagateInto(grid, outGrid, updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, periodic, seed, step):
+    """ One step from grid into outGrid, updatedGrid is scratch space. Nothing is allocated.
+    seed and step pick the random streams, the same (grid, seed, step) always gives the same result """
+    # the same interaction kernel the row stripes of tiledgrid.py run, over every row. It also zeroes outGrid, movement
+    # only adds into it
+    interactionRows(grid, outGrid, updatedGrid, 0, grid.shape[0], timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir,
+                    periodic, seed, step)
+    _propagateMovement(updatedGrid, outGrid, zombieDir, humanDir, moveProb, periodic, seed, step)
 
-    for i in range(rows * cols):  # Single prange over all elements
-        row, col = divmod(i, cols)
-        propagateMovementCELL(updatedGrid, int(row), int(col), movementGrid, zombieDir, humanDir, moveProb)
-    
     # maxPerCell = totalPop/updatedGrid.size
     # return np.clip(movementGrid,-maxPerCell,maxPerCell), totalRecovered
-    return movementGrid
 
 
-@njit
-def propagate(grid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, totalPop, maxStepSize):
-    if timeStep <= maxStepSize:
-        return _propagate(grid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, totalPop)
-    else:
-        finalGrid = None
+# Row range versions of the phases above, for when the grid is split into stripes of rows that are stepped by different
+# processes (tiledgrid.py). Every one works on the full grid arrays and only touches the rows it is given
+
+@njit(parallel=True, cache=True)
+def interactionRows(grid, outGrid, updatedGrid, rowStart, rowEnd, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, seed, step):
+    """ The interaction half of _propagateInto for rows [rowStart, rowEnd) """
+    cols = grid.shape[1]
+    for i in prange((rowEnd - rowStart) * cols):
+        row, col = divmod(i, cols)
+        row, col = int(row) + rowStart, int(col)
+        stream = cellStream(seed, step, INTERACTION_PHASE, row * cols + col)
+        cellChange = propagateInteractionsCELL(grid, row, col, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, stream)
+        updatedGrid[row, col] = grid[row, col] + cellChange * timeStep
+        outGrid[row, col] = 0
+
+@njit(parallel=True, cache=True)
+def movementRows(updatedGrid, movementGrid, rowStart, rowEnd, colour, zombieDir, humanDir, moveProb, periodic, seed, step):
+    """ Movement of the rows of one colour in [rowStart, rowEnd), see movementRowsColoured for the rows left out on a torus """
+    rows, cols = updatedGrid.shape
+    first = rowStart + (colour - rowStart) % 3
+    end = min(rowEnd, movementRowsColoured(rows, periodic))
+    for i in prange(max(0, (end - first + 2) // 3)):
+        row = first + 3 * np.int64(i)
+        for col in range(cols):
+            stream = cellStream(seed, step, MOVEMENT_PHASE, row * cols + col)
+            propagateMovementCELL(updatedGrid, row, col, movementGrid, zombieDir, humanDir, moveProb, periodic, stream)
+
+@njit(cache=True)
+def movementTailRows(updatedGrid, movementGrid, zombieDir, humanDir, moveProb, periodic, seed, step):
+    """ The rows movementRowsColoured leaves out, run after all three colours """
+    rows, cols = updatedGrid.shape
+    for row in range(movementRowsColoured(rows, periodic), rows):
+        for col in range(cols):
+            stream = cellStream(seed, step, MOVEMENT_PHASE, row * cols + col)
+            propagateMovementCELL(updatedGrid, row, col, movementGrid, zombieDir, humanDir, moveProb, periodic, stream)
+
+@njit(cache=True)
+def rowStatsInto(grid, rowStats, rowStart, rowEnd):
+    """ The per row partials of gridStats for rows [rowStart, rowEnd), summing all of rowStats gives gridStats """
+    cols = grid.shape[1]
+    for row in range(rowStart, rowEnd):
+        rowStats[row] = 0
+        for col in range(cols):
+            pop = grid[row, col]
+            if pop > 0:
+                rowStats[row, 0] += pop
+                rowStats[row, 2] += 1
+            elif pop < 0:
+                rowStats[row, 1] -= pop
+                rowStats[row, 3] += 1
+
+
+@njit(parallel=True, cache=True)
+def gridStats(grid):
+    """ (humans, zombies, human filled cells, zombie filled cells) in a single pass over the grid """
+    rows, cols = grid.shape
+    rowStats = np.zeros((rows, 4), dtype=np.float64)  # per row partials, summed once at the end
+    for row in prange(rows):
+        for col in range(cols):
+            pop = grid[row, col]
+            if pop > 0:
+                rowStats[row, 0] += pop
+                rowStats[row, 2] += 1
+            elif pop < 0:
+                rowStats[row, 1] -= pop
+                rowStats[row, 3] += 1
+    stats = rowStats.sum(axis=0)
+    return stats[0], stats[1], int(stats[2]), int(stats[3])
+
+
+@njit(cache=True)
+def propagateSteps(grid, backGrid, updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, maxStepSize, periodic, seed, step):
+    """ Runs timeStep as chained substeps of at most maxStepSize, each one reads the result of the last.
+    grid and backGrid are swapped every substep, step counts substeps for the random streams.
+    Returns (current grid, spare buffer, gridStats of the current grid, next step) """
+    while timeStep > 0:
+        smallStep = min(timeStep, maxStepSize) # for when:  0 < timestep < maxStepsize
+        timeStep -= maxStepSize
+        _propagateInto(grid, backGrid, updatedGrid, smallStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, periodic, seed, step)
+        grid, backGrid = backGrid, grid
+        step += 1
+    return grid, backGrid, gridStats(grid), step
+
+
+@njit(cache=True)
+def propagate(grid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, totalPop, maxStepSize, periodic, seed, step):
+    """ Allocating version of propagateSteps, returns a new grid """
+    result, _, _, _ = propagateSteps(grid.copy(), np.empty_like(grid), np.empty_like(grid), timeStep, infectionGrowth, zombieLoss, humanLoss,
+                                     zombieDir, humanDir, moveProb, maxStepSize, periodic, seed, step)
+    return result
+
+
+# Adaptive stepping: the substep size comes from the largest relative change the interactions would make to a cell,
+# so quiet phases take few long substeps and busy ones many short ones. Movement happens once per substep, so its
+# probability is scaled to the substep length to keep the movement per unit of time the same
+ADAPTIVE_SAFETY = 0.9
+ADAPTIVE_GROWTH = 2.0  # a substep is at most this many times longer than the one before
+ADAPTIVE_END = 1e-9  # relative to the time asked for
+
+@njit(parallel=True, cache=True)
+def interactionRates(grid, rates, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, seed, step):
+    """ Writes every cell's change per unit of time into rates, returns the largest |change| / |population| """
+    rows, cols = grid.shape
+    rowMax = np.zeros(rows)
+    for i in prange(rows):
+        row = np.int64(i)  # parfor indices can come out unsigned, which would make the neighbour indices floats
+        for col in range(cols):
+            stream = cellStream(seed, step, INTERACTION_PHASE, row * cols + col)
+            rate = propagateInteractionsCELL(grid, row, col, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, stream)
+            rates[row, col] = rate
+            if rate != 0 and abs(grid[row, col]) > 1e-3:  # smaller cells are dropped by movement anyway, they can't hold up the step
+                rowMax[row] = max(rowMax[row], abs(rate) / abs(grid[row, col]))
+    return rowMax.max()
+
+@njit(parallel=True, cache=True)
+def _applyRates(grid, rates, outGrid, timeStep):
+    """ rates becomes grid + rates * timeStep in place, a cell that would change sign is emptied instead """
+    rows, cols = grid.shape
+    for row in prange(rows):
+        for col in range(cols):
+            pop = grid[row, col]
+            newPop = pop + rates[row, col] * timeStep
+            rates[row, col] = 0 if (pop > 0 and newPop < 0) or (pop < 0 and newPop > 0) else newPop
+            outGrid[row, col] = 0
+
+@njit(cache=True)
+def movementProbability(moveProb, timeStep):
+    """ Chance to move in a substep of timeStep when moveProb is the chance per unit of time """
+    return moveProb if timeStep == 1 else 1 - (1 - moveProb) ** timeStep
+
+@njit(cache=True)
+def propagateAdaptiveSteps(grid, backGrid, updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb,
+                           maxStepSize, tolerance, stepSize, periodic, seed, step, maxSubsteps):
+    """ Runs timeStep as substeps no cell changes by more than tolerance (relative) in, and no longer than maxStepSize.
+    stepSize is the substep to try first, with maxSubsteps > 0 it stops early after that many.
+    Returns (grid, spare buffer, gridStats, next step, next stepSize to try, time advanced, how many substeps had to be shortened) """
+    rejected = 0
+    advanced = 0.0
+    substeps = 0
+    end = timeStep * ADAPTIVE_END  # whatever is left below this is rounding, not time still to run
+    while timeStep > end and (maxSubsteps <= 0 or substeps < maxSubsteps):
+        maxRate = interactionRates(grid, updatedGrid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, seed, step)
+        tryStep = min(stepSize, maxStepSize)
+        smallStep = min(tryStep, timeStep)
+        shortened = False
+        if maxRate * smallStep > tolerance:
+            # rejected, the rates don't depend on the step size so the shorter step reuses them
+            smallStep = ADAPTIVE_SAFETY * tolerance / maxRate
+            rejected += 1
+            shortened = True
+        _applyRates(grid, updatedGrid, backGrid, smallStep)
+        _propagateMovement(updatedGrid, backGrid, zombieDir, humanDir, movementProbability(moveProb, smallStep), periodic, seed, step)
+        grid, backGrid = backGrid, grid
+        step += 1
+        substeps += 1
+        timeStep -= smallStep
+        advanced += smallStep
+
+        target = maxStepSize if maxRate == 0 else ADAPTIVE_SAFETY * tolerance / maxRate
+        if smallStep < tryStep and not shortened:
+            stepSize = min(tryStep, target)  # cut short to hit the end of timeStep, don't grow from the short one
+        else:
+            stepSize = min(maxStepSize, ADAPTIVE_GROWTH * smallStep, target)
+    return grid, backGrid, gridStats(grid), step, stepSize, advanced, rejected
+
+
+# Active cell mode: a step can only change cells that are non-zero or next to one, so on mostly empty grids only those
+# are visited. The active list holds the row major indices of the non-zero cells, sorted, and gives exactly the same
+# results as the dense kernels (same streams, same per cell order of the movement sums)
+
+@njit(cache=True)
+def activeCells(grid):
+    """ Sorted row major indices of the non-zero cells """
+    return np.flatnonzero(grid.ravel() != 0)
+
+@njit(cache=True)
+def rowPointers(active, rows, cols):
+    """ CSR style row pointer, the active cells of row r are active[rowPtr[r]:rowPtr[r + 1]] """
+    rowPtr = np.zeros(rows + 1, dtype=np.int64)
+    for cell in active:
+        rowPtr[cell // cols + 1] += 1
+    return np.cumsum(rowPtr)
+
+@njit(cache=True)
+def _activeMovementRow(updatedGrid, movementGrid, active, rowPtr, row, zombieDir, humanDir, moveProb, periodic, seed, step):
+    cols = updatedGrid.shape[1]
+    for j in range(rowPtr[row], rowPtr[row + 1]):
+        stream = cellStream(seed, step, MOVEMENT_PHASE, active[j])
+        propagateMovementCELL(updatedGrid, row, active[j] - row * cols, movementGrid, zombieDir, humanDir, moveProb, periodic, stream)
+
+@njit(cache=True)
+def _nextActive(outGrid, active, marks, periodic):
+    """ Non-zero cells of outGrid, they can only be active cells or their neighbours. marks is all zeros before and after """
+    rows, cols = outGrid.shape
+    candidates = np.empty(len(active) * NEIGHBOR_SLOTS, dtype=np.int64)
+    count = 0
+    for clear in range(2):  # first pass collects, second one resets the marks
+        for cell in active:
+            row, col = cell // cols, cell % cols
+            for dx in range(-1, 2):
+                for dy in range(-1, 2):
+                    newRow, newCol = row + dx, col + dy
+                    if periodic:
+                        newRow, newCol = newRow % rows, newCol % cols
+                    elif not (0 <= newRow < rows and 0 <= newCol < cols):
+                        continue
+                    if clear:
+                        marks[newRow, newCol] = 0
+                    elif marks[newRow, newCol] == 0:
+                        marks[newRow, newCol] = 1
+                        if outGrid[newRow, newCol] != 0:
+                            candidates[count] = newRow * cols + newCol
+                            count += 1
+    return np.sort(candidates[:count])
+
+@njit(parallel=True, cache=True)
+def _propagateActiveInto(grid, outGrid, updatedGrid, active, outActive, marks, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, periodic, seed, step):
+    """ Same step as _propagateInto but only visits the active cells of grid. outActive are the cells outGrid may still
+    hold from earlier, updatedGrid has to be all zeros (it is left that way). Returns the active cells of outGrid """
+    rows, cols = grid.shape
+
+    for j in prange(len(outActive)):
+        outGrid[outActive[j] // cols, outActive[j] % cols] = 0
+
+    for j in prange(len(active)):
+        row, col = active[j] // cols, active[j] % cols
+        stream = cellStream(seed, step, INTERACTION_PHASE, active[j])
+        cellChange = propagateInteractionsCELL(grid, row, col, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, stream)
+        updatedGrid[row, col] = grid[row, col] + cellChange * timeStep
+
+    # same row colouring as _propagateMovement, empty rows cost one lookup
+    rowPtr = rowPointers(active, rows, cols)
+    colouredRows = movementRowsColoured(rows, periodic)
+    for colour in range(3):
+        for i in prange((colouredRows - colour + 2) // 3):
+            _activeMovementRow(updatedGrid, outGrid, active, rowPtr, colour + 3 * i, zombieDir, humanDir, moveProb, periodic, seed, step)
+    for row in range(colouredRows, rows):
+        _activeMovementRow(updatedGrid, outGrid, active, rowPtr, row, zombieDir, humanDir, moveProb, periodic, seed, step)
+
+    for j in prange(len(active)):
+        updatedGrid[active[j] // cols, active[j] % cols] = 0
+
+    return _nextActive(outGrid, active, marks, periodic)
+
+
+@njit(cache=True)
+def activeStats(grid, active):
+    """ gridStats from the active cells only, summed per row in the same order so the results match exactly """
+    rows, cols = grid.shape
+    rowStats = np.zeros((rows, 4), dtype=np.float64)
+    for cell in active:
+        row = cell // cols
+        pop = grid[row, cell % cols]
+        if pop > 0:
+            rowStats[row, 0] += pop
+            rowStats[row, 2] += 1
+        elif pop < 0:
+            rowStats[row, 1] -= pop
+            rowStats[row, 3] += 1
+    stats = rowStats.sum(axis=0)
+    return stats[0], stats[1], int(stats[2]), int(stats[3])
+
+
+@njit(cache=True)
+def propagateActiveSteps(grid, backGrid, updatedGrid, active, backActive, marks, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, maxStepSize, periodic, seed, step):
+    """ propagateSteps for the active cell mode, the active lists are swapped along with the grids.
+    Returns (current grid, spare buffer, its active cells, spare buffer's active cells, stats, next step) """
+    while timeStep > 0:
+        smallStep = min(timeStep, maxStepSize)
+        timeStep -= maxStepSize
+        backActive = _propagateActiveInto(grid, backGrid, updatedGrid, active, backActive, marks, smallStep, infectionGrowth, zombieLoss, humanLoss,
+                                          zombieDir, humanDir, moveProb, periodic, seed, step)
+        grid, backGrid = backGrid, grid
+        active, backActive = backActive, active
+        step += 1
+    return grid, backGrid, active, backActive, activeStats(grid, active), step
+
+
+STOP_EXTINCTION, STOP_STAGNATION, STOP_MAX_TIME, STOP_STALLED = 0, 1, 2, 3
+
+@njit(cache=True)
+def _recordRow(records, count, recordEvery, t, stats):
+    """ Appends (t, H, Z) to records, when full every other row is dropped and the spacing doubles.
+    Returns (count, recordEvery) """
+    if count == len(records):
+        half = (count + 1) // 2
+        for i in range(half):
+            records[i] = records[2 * i]
+        count = half
+        recordEvery *= 2
+    records[count, 0], records[count, 1], records[count, 2] = t, stats[0], stats[1]
+    return count + 1, recordEvery
+
+@njit(cache=True)
+def runUntil(grid, backGrid, updatedGrid, active, backActive, marks, sparse, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir,
+             moveProb, maxStepSize, periodic, seed, step, timePassed, stats, maxTime, atoi, stagnationWindow, stagnationEps, recordEvery, maxRecords,
+             adaptive, tolerance, stepSize):
+    """ Steps until humans or zombies are within atoi of 0, H and Z both changed by less than stagnationEps (relative)
+    over the last stagnationWindow steps (0 turns that off) or maxTime has passed, without going back to Python.
+    Every recordEvery-th step goes into a trajectory of at most maxRecords rows (t, H, Z), thinned out as it fills.
+    With adaptive every step is a single propagateAdaptiveSteps substep of whatever length it allows (stepSize is the first to try)
+    Returns (grid, backGrid, active, backActive, stats, step, timePassed, stop reason, trajectory, stepSize, shortened substeps) """
+    records = np.empty((maxRecords, 3))
+    count, recordEvery = _recordRow(records, 0, recordEvery, timePassed, stats)
+    window = np.empty((max(stagnationWindow, 1), 2))  # H, Z of the last stagnationWindow steps, as a ring
+    steps = 0
+    rejected = 0
+    while True:
+        if abs(stats[0]) <= atoi or abs(stats[1]) <= atoi:
+            reason = STOP_EXTINCTION
+            break
+        if stagnationWindow > 0 and steps >= stagnationWindow:
+            old = window[steps % stagnationWindow]
+            changeH = abs(stats[0] - old[0]) / max(abs(old[0]), 1e-12)
+            changeZ = abs(stats[1] - old[1]) / max(abs(old[1]), 1e-12)
+            if changeH < stagnationEps and changeZ < stagnationEps:
+                reason = STOP_STAGNATION
+                break
+        if timePassed >= maxTime:
+            reason = STOP_MAX_TIME
+            break
+        if stagnationWindow > 0:
+            window[steps % stagnationWindow, 0], window[steps % stagnationWindow, 1] = stats[0], stats[1]
+
+        if adaptive:
+            # one substep at most, so the span only has to be long enough for it. Handing over all of maxTime - timePassed
+            # would make the rounding cut off of propagateAdaptiveSteps huge (or inf) for far away maxTimes
+            span = min(maxTime - timePassed, maxStepSize)
+            grid, backGrid, stats, step, stepSize, advanced, shortened = propagateAdaptiveSteps(
+                grid, backGrid, updatedGrid, span, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb,
+                maxStepSize, tolerance, stepSize, periodic, seed, step, 1)
+            rejected += shortened
+            if advanced <= 0:
+                reason = STOP_STALLED  # would spin here forever otherwise
+                break
+        elif sparse:
+            grid, backGrid, active, backActive, stats, step = propagateActiveSteps(grid, backGrid, updatedGrid, active, backActive, marks, timeStep,
+                                                                                   infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir,
+                                                                                   moveProb, maxStepSize, periodic, seed, step)
+        else:
+            grid, backGrid, stats, step = propagateSteps(grid, backGrid, updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss,
+                                                         zombieDir, humanDir, moveProb, maxStepSize, periodic, seed, step)
+        timePassed += advanced if adaptive else timeStep
+        steps += 1
+        if steps % recordEvery == 0:
+            count, recordEvery = _recordRow(records, count, recordEvery, timePassed, stats)
+
+    if records[count - 1, 0] != timePassed:
+        count, recordEvery = _recordRow(records, count, recordEvery, timePassed, stats)  # always end on the final state
+    return grid, backGrid, active, backActive, stats, step, timePassed, reason, records[:count].copy(), stepSize, rejected
+
+
+@njit(parallel=True, cache=True)
+def _propagateEnsembleInto(grids, outGrids, updatedGrids, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, periodic, seeds, step):
+    """ seeds holds one seed per replica, replica i gets the same streams a lone grid with seeds[i] would """
+    replicas, rows, cols = grids.shape
+    cells = rows * cols
+
+    for i in prange(replicas * cells):  # Single prange over every cell of every replica
+        replica, cell = divmod(i, cells)
+        replica, row, col = int(replica), int(cell // cols), int(cell % cols)
+        stream = cellStream(seeds[replica], step, INTERACTION_PHASE, cell)
+        cellChange = propagateInteractionsCELL(grids[replica], row, col, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, stream)
+        updatedGrids[replica, row, col] = grids[replica, row, col] + cellChange * timeStep
+        outGrids[replica, row, col] = 0
+
+    # Same row colouring as _propagateMovement, with the rows of every replica in one loop per colour
+    colouredRows = movementRowsColoured(rows, periodic)
+    for colour in range(3):
+        colourRows = (colouredRows - colour + 2) // 3
+        for i in prange(replicas * colourRows):
+            replica, colourRow = divmod(i, colourRows)
+            replica, row = int(replica), int(colour + 3 * colourRow)
+            for col in range(cols):
+                stream = cellStream(seeds[replica], step, MOVEMENT_PHASE, row * cols + col)
+                propagateMovementCELL(updatedGrids[replica], row, col, outGrids[replica], zombieDir, humanDir, moveProb, periodic, stream)
+
+    for replica in prange(replicas):
+        for row in range(colouredRows, rows):
+            for col in range(cols):
+                stream = cellStream(seeds[replica], step, MOVEMENT_PHASE, row * cols + col)
+                propagateMovementCELL(updatedGrids[replica], row, col, outGrids[replica], zombieDir, humanDir, moveProb, periodic, stream)
+
+
+@njit(cache=True)
+def propagateEnsembleSteps(grids, backGrids, updatedGrids, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, maxStepSize, periodic, seeds, step):
+    """ Same as propagateSteps but for stacked (replicas, rows, cols) arrays, returns (grids, spare buffers, next step) """
+    while timeStep > 0:
+        smallStep = min(timeStep, maxStepSize)
+        timeStep -= maxStepSize
+        _propagateEnsembleInto(grids, backGrids, updatedGrids, smallStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, periodic, seeds, step)
+        grids, backGrids = backGrids, grids
+        step += 1
+    return grids, backGrids, step
 
-        while timeStep > 0:
-            smallStep = min(timeStep, maxStepSize) # for when:  0 < timestep < maxStepsize
-            timeStep -= maxStepSize
-            finalGrid = _propagate(grid, smallStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, totalPop)
 
-        return finalGrid
+@njit(parallel=True, cache=True)
+def ensemblePopulations(grids):
+    """ Returns (humans, zombies) per replica """
+    replicas = grids.shape[0]
+    humans = np.zeros(replicas, dtype=np.float64)
+    zombies = np.zeros(replicas, dtype=np.float64)
+    for replica in prange(replicas):
+        grid = grids[replica]
+        h = 0.0
+        z = 0.0
+        for row in range(grid.shape[0]):
+            for col in range(grid.shape[1]):
+                pop = grid[row, col]
+                if pop > 0:
+                    h += pop
+                elif pop < 0:
+                    z -= pop
+        humans[replica] = h
+        zombies[replica] = z
+    return humans, zombies
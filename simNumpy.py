@@ -0,0 +1,128 @@
+import numpy as np
+from randomstreams import PERMUTATIONS3, NEIGHBOR_SLOTS, GOLDEN, INTERACTION_PHASE, MOVEMENT_PHASE, mix64
+
+# The rules of simNjits as whole array numpy operations, for when numba isn't installed or its compile time would be
+# most of a short run. Instead of visiting one cell at a time, every slot of the 3x3 stencil is handled for all cells
+# at once: each cell's neighbour for that slot is gathered with fancy indexing, and what moves is scattered back with
+# bincount. The random streams are the same counter based ones, so every decision a cell makes is the one simNjits
+# makes; only the order movement is summed into a cell differs, so results agree up to rounding
+
+
+def cellStreams(seed, step, phase, cells):
+    """ simNjits.cellStream of every cell index in cells """
+    key = mix64(np.uint64(seed) + np.array([step], dtype=np.uint64) * GOLDEN)
+    key = mix64(key + np.uint64(phase) * GOLDEN)
+    return mix64(key + cells.astype(np.uint64) * GOLDEN)
+
+
+def randomUniform(streams, draws):
+    """ Draw draws (a number or one per stream) of every stream """
+    return (mix64(streams + (np.asarray(draws) + 1).astype(np.uint64) * GOLDEN) >> np.uint64(11)) * (1.0 / 9007199254740992.0)
+
+
+def randomNeighborOrder(streams):
+    return (randomUniform(streams, 0) * 6).astype(np.int64), (randomUniform(streams, 1) * 6).astype(np.int64)
+
+
+def getNeighbors(slot, rowOrder, colOrder, rows, cols, shape, periodic):
+    """ Flat index of neighbour number slot of every cell (rows/cols its coordinates) and whether it exists.
+    Missing neighbours point at the cell itself so they can still be gathered """
+    newRows = rows + PERMUTATIONS3[rowOrder, slot // 3] - 1
+    newCols = cols + PERMUTATIONS3[colOrder, slot % 3] - 1
+    valid = (newRows != rows) | (newCols != cols)
+    if periodic:
+        newRows %= shape[0]
+        newCols %= shape[1]
+    else:
+        valid &= (newRows >= 0) & (newRows < shape[0]) & (newCols >= 0) & (newCols < shape[1])
+        newRows = np.where(valid, newRows, rows)
+        newCols = np.where(valid, newCols, cols)
+    return newRows * shape[1] + newCols, valid
+
+
+def interactionChanges(grid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, seed, step):
+    """ propagateInteractionsCELL for every cell, the flat change per unit of time """
+    pop = np.asarray(grid, dtype=np.float64).ravel()  # float32 grids too, simNjits also does the arithmetic in float64
+    changes = np.zeros(pop.size)
+    cells = np.flatnonzero(~np.isclose(pop, 0))  # empty cells don't change
+    if len(cells) == 0:
+        return changes
+    rows, cols = np.divmod(cells, grid.shape[1])
+    rowOrder, colOrder = randomNeighborOrder(cellStreams(seed, step, INTERACTION_PHASE, cells))
+    cellPop = pop[cells]
+    cellPopAbs = np.abs(cellPop)
+    human = cellPop > 0
+    cellLoss = np.where(human, humanLoss, zombieLoss)
+    cellGrowthDir = np.where(human, humanDir, zombieDir)
+
+    total = np.zeros(len(cells))
+    for slot in range(NEIGHBOR_SLOTS):  # slot by slot, so every cell adds its neighbours up in the same order as simNjits
+        neighbors, valid = getNeighbors(slot, rowOrder, colOrder, rows, cols, grid.shape, periodic)
+        neighborPop = pop[neighbors]
+        interacts = valid & ~np.isclose(neighborPop, 0) & (human != (neighborPop > 0))
+        interactionAbs = np.minimum(cellPopAbs, np.abs(neighborPop))
+        change = interactionAbs * infectionGrowth * zombieDir
+        cellChangeLoss = np.minimum(interactionAbs * cellLoss * cellGrowthDir, cellPopAbs)
+        total[interacts] += (change - cellChangeLoss)[interacts]
+    changes[cells] = total
+    return changes
+
+
+def movementInto(updatedGrid, movementGrid, zombieDir, humanDir, moveProb, periodic, seed, step):
+    """ propagateMovementCELL for every cell, adds everything that moves or stays into movementGrid """
+    pop = np.asarray(updatedGrid, dtype=np.float64).ravel()
+    cells = np.flatnonzero(~np.isclose(pop, 0, atol=1e-3))  # smaller cells are dropped
+    if len(cells) == 0:
+        return
+    rows, cols = np.divmod(cells, updatedGrid.shape[1])
+    streams = cellStreams(seed, step, MOVEMENT_PHASE, cells)
+    rowOrder, colOrder = randomNeighborOrder(streams)
+    cellPop = pop[cells]
+    human = cellPop > 0
+    cellGrowthDir = np.where(human, humanDir, zombieDir)
+    cellPopAbs = np.abs(cellPop)
+    draws = np.full(len(cells), 2, dtype=np.int64)  # every cell uses its own stream, so each keeps its own draw count
+    moved = np.zeros(pop.size)
+
+    for slot in range(NEIGHBOR_SLOTS):
+        neighbors, valid = getNeighbors(slot, rowOrder, colOrder, rows, cols, updatedGrid.shape, periodic)
+        trying = valid & (cellPopAbs > 0)
+        lucky = trying & (randomUniform(streams, draws) <= moveProb)
+        draws += trying
+        neighborPop = pop[neighbors]
+        leaving = lucky & (np.isclose(neighborPop, 0, atol=1e-3) | (human == (neighborPop > 0)))
+        amountLeaveAbs = randomUniform(streams, draws) * cellPopAbs
+        draws += leaving
+        cellPopAbs = np.where(leaving, cellPopAbs - amountLeaveAbs, cellPopAbs)
+        moved += np.bincount(neighbors[leaving], (amountLeaveAbs * cellGrowthDir)[leaving], minlength=pop.size)
+
+    moved[cells] += cellPopAbs * cellGrowthDir
+    movementGrid += moved.reshape(updatedGrid.shape)
+
+
+def propagateInto(grid, outGrid, updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, periodic, seed, step):
+    """ One step from grid into outGrid, same as simNjits._propagateInto """
+    changes = interactionChanges(grid, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, periodic, seed, step)
+    np.add(grid, (changes * timeStep).reshape(grid.shape), out=updatedGrid)
+    outGrid[...] = 0
+    movementInto(updatedGrid, outGrid, zombieDir, humanDir, moveProb, periodic, seed, step)
+
+
+def gridStats(grid):
+    """ (humans, zombies, human filled cells, zombie filled cells) """
+    humans = grid > 0
+    zombies = grid < 0
+    return float(grid.sum(where=humans, dtype=np.float64)), float(-grid.sum(where=zombies, dtype=np.float64)), int(humans.sum()), int(zombies.sum())
+
+
+def propagateSteps(grid, backGrid, updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb, maxStepSize, periodic, seed, step):
+    """ Same as simNjits.propagateSteps """
+    with np.errstate(over="ignore"):  # the random streams rely on uint64 wrapping around
+        while timeStep > 0:
+            smallStep = min(timeStep, maxStepSize)
+            timeStep -= maxStepSize
+            propagateInto(grid, backGrid, updatedGrid, smallStep, infectionGrowth, zombieLoss, humanLoss, zombieDir, humanDir, moveProb,
+                          periodic, seed, step)
+            grid, backGrid = backGrid, grid
+            step += 1
+    return grid, backGrid, gridStats(grid), step
@@ -0,0 +1,110 @@
+import numpy as np
+import simNjits
+from simgrid import SimGrid
+from distributions import Uniform
+from metrics import DivergenceMetrics
+
+class SimEnsemble:
+    """ N independent SimGrid replicas stored as one (N, S, S) array and advanced by a single kernel call """
+    MAXSTEPSIZE = SimGrid.MAXSTEPSIZE
+
+    def __init__(self, replicas, populationSize, z0, infectionGrowth, zombieLoss, humanLoss, gridCellCount=1000, moveProb=0.05, periodic=False, seed=None, dtype=np.float64):
+        self.replicas = replicas
+        self.popSize = populationSize
+        self.moveProb = moveProb
+        self.periodic = periodic
+
+        self.infectionGrowth = infectionGrowth
+        self.z0 = z0
+        self.zombieLoss = zombieLoss
+        self.zombieDir = -1
+        self.h0 = populationSize - z0
+        self.humanLoss = humanLoss
+        self.humanDir = 1
+
+        self.gridCellCount, self.squareSize = SimGrid.getNearestSquareCellCount(gridCellCount)
+
+        # replica i is exactly what SimGrid(..., seed=[seed, i]) would produce on its own
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        # Placed straight into the ensemble, no SimGrid (and its buffers) per replica on the way
+        self.grids = np.zeros((replicas, self.squareSize, self.squareSize), dtype=dtype)
+        self._kernelSeeds = np.empty(replicas, dtype=np.uint64)
+        for replica in range(replicas):
+            rng, self._kernelSeeds[replica] = SimGrid.seedStreams([self.seed, replica])
+            SimGrid.placePopulations(self.grids[replica], rng, self.h0, z0, Uniform(), Uniform())
+        self.stepCount = 0
+        self._backGrids = np.zeros_like(self.grids)
+        self._updatedGrids = np.zeros_like(self.grids)
+
+        self.timePassed = 0
+        self.time_stamps = []
+        self.human_populations = []
+        self.zombie_populations = []
+        self.metrics = None  # see compareTo
+        self._solver = None
+        self._record()
+
+    def _record(self):
+        humans, zombies = simNjits.ensemblePopulations(self.grids)
+        self.time_stamps.append(self.timePassed)
+        self.human_populations.append(humans)
+        self.zombie_populations.append(zombies)
+        if self._solver is not None:
+            solverH, solverZ, _ = self._solver.getPopulations(self.timePassed)
+            self.metrics.update(self.timePassed, humans, zombies, solverH, solverZ)
+
+    def compareTo(self, solver, atoi=1e-3):
+        """ From now on every step also updates self.metrics, a DivergenceMetrics of every replica against solver """
+        self._solver = solver
+        self.metrics = DivergenceMetrics(self.popSize, self.replicas, atoi)
+        solverH, solverZ, _ = solver.getPopulations(self.timePassed)
+        self.metrics.update(self.timePassed, self.getHumanPopulation(), self.getZombiePopulation(), solverH, solverZ)
+
+    def propagate(self, timeStep=1):
+        """ Advances every replica by timeStep and records their populations """
+        self.timePassed += timeStep
+        self.grids, self._backGrids, self.stepCount = simNjits.propagateEnsembleSteps(
+            self.grids, self._backGrids, self._updatedGrids, float(timeStep), float(self.infectionGrowth), float(self.zombieLoss),
+            float(self.humanLoss), self.zombieDir, self.humanDir, float(self.moveProb), self.MAXSTEPSIZE, self.periodic,
+            self._kernelSeeds, self.stepCount)
+        self._record()
+
+    def run(self, steps, timeStep=1):
+        for _ in range(steps):
+            self.propagate(timeStep)
+
+    # Latest populations, one value per replica
+    def getHumanPopulation(self):
+        return self.human_populations[-1]
+
+    def getZombiePopulation(self):
+        return self.zombie_populations[-1]
+
+    def getRecoveredPopulation(self):
+        return self.popSize - self.getHumanPopulation() - self.getZombiePopulation()
+
+    def isApocalypse(self, atoi=1e-3):
+        return np.isclose(self.getHumanPopulation(), 0, atol=atoi) | np.isclose(self.getZombiePopulation(), 0, atol=atoi)
+
+    def getTrajectories(self):
+        """ Returns times (T,) and H, Z, R trajectories of shape (T, replicas) """
+        times = np.array(self.time_stamps, dtype=np.float64)
+        humans = np.array(self.human_populations)
+        zombies = np.array(self.zombie_populations)
+        return times, humans, zombies, self.popSize - humans - zombies
+
+    def getAggregate(self, quantiles=(0.05, 0.5, 0.95)):
+        """ Mean and quantiles over replicas for every recorded time, quantile arrays have shape (len(quantiles), T) """
+        times, humans, zombies, recovered = self.getTrajectories()
+        aggregate = {"time": times, "quantiles": np.asarray(quantiles)}
+        for name, series in (("human", humans), ("zombie", zombies), ("recovered", recovered)):
+            aggregate[f"{name}_mean"] = series.mean(axis=1)
+            aggregate[f"{name}_quantiles"] = np.quantile(series, quantiles, axis=1)
+        return aggregate
+
+if __name__ == "__main__":
+    ensemble = SimEnsemble(32, 1010, 10, 0.1, 0.05, 0)
+    ensemble.run(50)
+    aggregate = ensemble.getAggregate()
+    print(f"t={ensemble.timePassed} Humans: {aggregate['human_mean'][-1]:.1f} {aggregate['human_quantiles'][:, -1]}")
+    print(f"t={ensemble.timePassed} Zombies: {aggregate['zombie_mean'][-1]:.1f} {aggregate['zombie_quantiles'][:, -1]}")
@@ -1,6 +1,29 @@
+import os
+import json
 import numpy as np
 import math
-import simNjits
+import simNumpy
+from distributions import Uniform
+from profiling import profiler
+
+try:
+    import simNjits
+except ImportError:  # numba isn't installed, the numpy backend still works
+    simNjits = None
+
+BACKENDS = ("numba", "numpy")
+
+def getBackend(name=None):
+    """ Kernel module of a backend: "numba" (simNjits, the default when it can be imported) or "numpy" (simNumpy) """
+    if name is None:
+        name = "numpy" if simNjits is None else "numba"
+    if name == "numpy":
+        return simNumpy
+    if name == "numba":
+        if simNjits is None:
+            raise ImportError("The numba backend needs numba, install it or use backend=\"numpy\"")
+        return simNjits
+    raise ValueError(f"Unknown backend {name}, expected one of {BACKENDS}")
 
 class SimGrid:
     MAXSTEPSIZE = 1
@@ -10,9 +33,32 @@ class SimGrid:
         gridCellCount = squareSize * squareSize  # nearest "resolution of grid"
         return gridCellCount, squareSize
 
-    def __init__(self, populationSize, z0, infectionGrowth, zombieLoss, humanLoss, gridCellCount=1000, moveProb=0.05):
+    def __init__(self, populationSize, z0, infectionGrowth, zombieLoss, humanLoss, gridCellCount=1000, moveProb=0.05, periodic=False, seed=None, sparse=False, dtype=np.float64, memmapDir=None,
+                 humanDistribution=None, zombieDistribution=None, adaptive=False, tolerance=0.05, maxAdaptiveStep=10, backend=None):
         self.popSize = populationSize
         self.moveProb = moveProb
+        self.periodic = periodic  # torus boundaries instead of hard edges
+        self.sparse = sparse  # only visit occupied cells and their neighbours, same results, faster on mostly empty grids
+        self.dtype = np.dtype(dtype)  # float32 halves memory and bandwidth, see benchmarks/precision.py for what it costs
+        self.memmapDir = memmapDir  # back the grid buffers with files in this directory, for grids that don't fit in RAM
+        # adaptive substeps: as long as no cell changes by more than tolerance (relative) in one, up to maxAdaptiveStep long
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.maxAdaptiveStep = maxAdaptiveStep
+        if adaptive and sparse:
+            raise ValueError("Adaptive stepping only works on dense grids")
+        # which kernels step the grid, see getBackend. Sparse, adaptive and runUntil are numba only
+        self._kernels = getBackend(backend)
+        self.backend = "numba" if self._kernels is simNjits else "numpy"
+        if self.backend != "numba" and (sparse or adaptive):
+            raise ValueError("Sparse and adaptive stepping need the numba backend")
+        self._stepSize = 1.0  # next adaptive substep to try
+        self.lastSubsteps = 0  # kernel steps the last propagate/runUntil took
+        self.rejectedSteps = 0  # adaptive substeps that had to be shortened, over the whole run
+        self._memmaps = {}
+        # where people start, see distributions.py
+        self.humanDistribution = Uniform() if humanDistribution is None else humanDistribution
+        self.zombieDistribution = Uniform() if zombieDistribution is None else zombieDistribution
 
         self.infectionGrowth = infectionGrowth  # growth percentage per day
 
@@ -27,15 +73,82 @@ class SimGrid:
 
         self.gridCellCount, self.squareSize = SimGrid.getNearestSquareCellCount(gridCellCount)
 
+        # Everything random comes from seed (an int or a sequence of ints), a fresh one is drawn if none is given.
+        # The initial placement and the kernel streams get independent children of it
+        self.seed = np.random.SeedSequence().entropy if seed is None else seed
+        self._rng, self._kernelSeed = SimGrid.seedStreams(self.seed)
+        self.stepCount = 0  # substeps taken, picks the kernel's random streams
+
         
 
-        self.grid = np.zeros(shape=(self.squareSize, self.squareSize), dtype=np.float64)
+        self.grid = self._allocateGrid("grid_a")
+        # propagate writes into the back buffer and swaps, updated grid is scratch space for the kernel
+        self._backGrid = self._allocateGrid("grid_b")
+        self._updatedGrid = self._allocateGrid("updated")
 
         # Initialize with initial conditions
-        self._initialize_grid(self.z0, self.h0)
+        SimGrid.placePopulations(self.grid, self._rng, self.h0, self.z0, self.humanDistribution, self.zombieDistribution)
+        if self.sparse:
+            # occupied cells of the back buffer, plus a scratch bitmap for finding the next ones
+            self._backActive = np.empty(0, dtype=np.int64)
+            self._marks = self._allocateGrid("marks", np.uint8)
+        self._refresh()
 
         self.timePassed = 0
 
+    def _refresh(self):
+        """ Recomputes what propagate otherwise keeps up to date, after the grid was written from outside """
+        if self.sparse:
+            # occupied cells of the grid
+            self._active = simNjits.activeCells(self.grid)
+            self._stats = simNjits.activeStats(self.grid, self._active)
+        else:
+            # (humans, zombies, human cells, zombie cells) of the current grid, refreshed by every propagate
+            self._stats = self._kernels.gridStats(self.grid)
+
+    def getState(self):
+        """ Everything needed to continue this run exactly, as a dict of arrays. The kernel's random streams only depend
+        on the seed and stepCount, so those two are the whole RNG state """
+        params = {"populationSize": self.popSize, "z0": self.z0, "infectionGrowth": self.infectionGrowth, "zombieLoss": self.zombieLoss,
+                  "humanLoss": self.humanLoss, "gridCellCount": self.gridCellCount, "moveProb": self.moveProb, "periodic": self.periodic,
+                  "seed": self.seed, "sparse": self.sparse, "dtype": self.dtype.name, "adaptive": self.adaptive, "tolerance": self.tolerance,
+                  "maxAdaptiveStep": self.maxAdaptiveStep, "backend": self.backend}
+        return {"params": np.array(json.dumps(params, default=int)), "grid": np.asarray(self.grid), "timePassed": np.array(self.timePassed),
+                "stepCount": np.array(self.stepCount), "stepSize": np.array(self._stepSize)}
+
+    @classmethod
+    def fromState(cls, state, memmapDir=None):
+        """ Rebuilds a grid from getState(), propagating it gives exactly what the original would have """
+        simGrid = cls(**json.loads(str(state["params"])), memmapDir=memmapDir)
+        simGrid.grid[...] = state["grid"]
+        simGrid.timePassed = state["timePassed"].item()
+        simGrid.stepCount = int(state["stepCount"])
+        if "stepSize" in state:
+            simGrid._stepSize = float(state["stepSize"])
+        simGrid._refresh()
+        return simGrid
+
+    def _allocateGrid(self, name, dtype=None):
+        """ A zeroed squareSize x squareSize buffer, in memory or in memmapDir/name.dat """
+        dtype = self.dtype if dtype is None else dtype
+        shape = (self.squareSize, self.squareSize)
+        profiler.count("allocations")
+        if self.memmapDir is None:
+            return np.zeros(shape, dtype=dtype)
+        os.makedirs(self.memmapDir, exist_ok=True)
+        self._memmaps[name] = np.memmap(os.path.join(self.memmapDir, f"{name}.dat"), dtype=dtype, mode="w+", shape=shape)
+        return self._memmaps[name].view(np.ndarray)  # plain array over the same mapping for the kernels
+
+    def flush(self):
+        """ Writes memory mapped buffers out, returns the file currently holding the grid (None when not memory mapped).
+        Open it with np.memmap(path, dtype=grid.dtype, mode="r", shape=grid.grid.shape) """
+        current = None
+        for name, buffer in self._memmaps.items():
+            buffer.flush()
+            if np.shares_memory(buffer, self.grid):
+                current = buffer.filename
+        return current
+
     def setinfectionGrowth(self, growth):
         self.infectionGrowth = growth
 
@@ -45,54 +158,106 @@ class SimGrid:
     def setHumanLoss(self, loss):
         self.humanLoss = loss
 
-    def _initialize_grid(self, z0, h0):
-        self._initialize_population(h0, self.humanDir)
-        self._initialize_population(z0, self.zombieDir, override=z0 < 50)
+    @staticmethod
+    def seedStreams(seed):
+        """ (generator for the initial placement, seed of the kernel streams) of a grid with seed, as independent
+        children of it """
+        initSeed, kernelSeed = np.random.SeedSequence(seed).spawn(2)
+        return np.random.default_rng(initSeed), kernelSeed.generate_state(1, dtype=np.uint64)[0]
 
-    def _initialize_population(self, population_count, direction, override=False):
-        # Randomly assign population to grid cells
-        indices = np.random.randint(0, self.gridCellCount, population_count)
-        rows, cols = np.unravel_index(indices, (self.squareSize, self.squareSize))
-        for row, col in zip(rows, cols):
-            if override:
-                self.grid[row, col] = direction
-            else:
-                self.grid[row, col] += direction
+    @staticmethod
+    def placePopulations(grid, rng, h0, z0, humanDistribution, zombieDistribution):
+        """ Adds h0 humans (positive) and then z0 zombies (negative) into an empty grid the way a new SimGrid does.
+        Goes in place and without grid sized temporaries, so memmapped grids bigger than RAM can be filled too.
+        Fewer than 50 zombies each hold a cell of their own, one zombie replaces whoever was there """
+        humanDistribution.place(rng, h0, grid, 1)
+        zombieDistribution.place(rng, z0, grid, -1, override=z0 < 50)
 
     def propagate(self, timeStep=1):
         """ Given a timestep goes over every cell, and applies the growth and loss equations for either humans or zombies """
         self.timePassed += timeStep
-        self.grid = simNjits.propagate(self.grid, timeStep, self.infectionGrowth, self.zombieLoss, self.humanLoss,
-                                    self.zombieDir, self.humanDir, self.moveProb, self.popSize, self.MAXSTEPSIZE)
-    
-    # Population counts and utility methods
+        # always floats so the kernels compile (and get cached) for a single signature, whatever types were passed in
+        timeStep, infectionGrowth, zombieLoss, humanLoss, moveProb = (float(value) for value in
+                                                                      (timeStep, self.infectionGrowth, self.zombieLoss, self.humanLoss, self.moveProb))
+        stepCount = self.stepCount
+        visited = len(self._active) if self.sparse else self.grid.size
+        with profiler.phase("step"):  # the compiled call as it is, the split into phases is benchmarks/suite.py's job
+            self._propagateKernel(timeStep, infectionGrowth, zombieLoss, humanLoss, moveProb)
+        self.lastSubsteps = self.stepCount - stepCount
+        profiler.count("substeps", self.lastSubsteps)
+        profiler.count("cells_visited", visited * self.lastSubsteps)  # sparse: the cells active when the call started, per substep
+
+    def _propagateKernel(self, timeStep, infectionGrowth, zombieLoss, humanLoss, moveProb):
+        if self.adaptive:
+            self.grid, self._backGrid, self._stats, self.stepCount, self._stepSize, _, rejected = simNjits.propagateAdaptiveSteps(
+                self.grid, self._backGrid, self._updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss, self.zombieDir, self.humanDir,
+                moveProb, float(self.maxAdaptiveStep), float(self.tolerance), self._stepSize, self.periodic, self._kernelSeed, self.stepCount, 0)
+            self.rejectedSteps += rejected
+        elif self.sparse:
+            self.grid, self._backGrid, self._active, self._backActive, self._stats, self.stepCount = simNjits.propagateActiveSteps(
+                self.grid, self._backGrid, self._updatedGrid, self._active, self._backActive, self._marks, timeStep, infectionGrowth,
+                zombieLoss, humanLoss, self.zombieDir, self.humanDir, moveProb, self.MAXSTEPSIZE, self.periodic,
+                self._kernelSeed, self.stepCount)
+        else:
+            self.grid, self._backGrid, self._stats, self.stepCount = self._kernels.propagateSteps(
+                self.grid, self._backGrid, self._updatedGrid, timeStep, infectionGrowth, zombieLoss, humanLoss,
+                self.zombieDir, self.humanDir, moveProb, self.MAXSTEPSIZE, self.periodic, self._kernelSeed, self.stepCount)
+
+    STOP_REASONS = ("extinction", "stagnation", "max_time", "stalled")  # indexed by simNjits.STOP_*
+
+    def runUntil(self, maxTime=50000, atoi=1e-3, timeStep=1, stagnationWindow=0, stagnationEps=1e-6, recordEvery=1, maxRecords=4096):
+        """ Propagates in compiled code until humans or zombies are within atoi of 0, H and Z changed by less than
+        stagnationEps (relative) over the last stagnationWindow steps (0 = never), or timePassed reaches maxTime.
+        Returns (stop reason, trajectory) where the trajectory has rows (time, H, Z, R) for every recordEvery-th step,
+        thinned to every other row whenever it reaches maxRecords rows (rounded up to even, so the thinned rows stay
+        evenly spaced). An adaptive grid ignores timeStep and takes one substep of whatever length the tolerance allows
+        per step, it needs a finite maxTime and stops as "stalled" if a substep can't advance the time """
+        if self.backend != "numba":
+            raise ValueError("runUntil needs the numba backend, call propagate in a loop instead")
+        if self.adaptive and not np.isfinite(maxTime):
+            raise ValueError("An adaptive runUntil needs a finite maxTime")
+        timeStep, infectionGrowth, zombieLoss, humanLoss, moveProb = (float(value) for value in
+                                                                      (timeStep, self.infectionGrowth, self.zombieLoss, self.humanLoss, self.moveProb))
+        if self.sparse:
+            active, backActive, marks = self._active, self._backActive, self._marks
+        else:
+            active = backActive = np.empty(0, dtype=np.int64)
+            marks = np.empty((0, 0), dtype=np.uint8)
+        stepCount = self.stepCount
+        maxStepSize = float(self.maxAdaptiveStep if self.adaptive else self.MAXSTEPSIZE)
+        with profiler.phase("run_until"):
+            (self.grid, self._backGrid, active, backActive, self._stats, self.stepCount, self.timePassed, reason, records, self._stepSize,
+             rejected) = simNjits.runUntil(
+                self.grid, self._backGrid, self._updatedGrid, active, backActive, marks, self.sparse, timeStep, infectionGrowth, zombieLoss,
+                humanLoss, self.zombieDir, self.humanDir, moveProb, maxStepSize, self.periodic, self._kernelSeed, self.stepCount,
+                float(self.timePassed), self._stats, float(maxTime), float(atoi), stagnationWindow, float(stagnationEps), recordEvery,
+                max(maxRecords + maxRecords % 2, 2), self.adaptive, float(self.tolerance), self._stepSize)
+        self.lastSubsteps = self.stepCount - stepCount
+        profiler.count("substeps", self.lastSubsteps)
+        self.rejectedSteps += rejected
+        if self.sparse:
+            self._active, self._backActive = active, backActive
+        trajectory = np.column_stack((records, self.popSize - records[:, 1] - records[:, 2]))
+        return self.STOP_REASONS[reason], trajectory
+
+    # Population counts and utility methods, all served from the stats cached by the last propagate
     def getZombiePopulation(self):
-        return self.__getPopulation(self.zombieDir)
+        return self._stats[1]
 
     def getHumanPopulation(self):
-        return self.__getPopulation(self.humanDir)
+        return self._stats[0]
 
     def getRecoveredPopulation(self):
         return self.popSize-self.getHumanPopulation()-self.getZombiePopulation()
 
     def getHumanCount(self):
-        return self.__getFilled(self.humanDir)
+        return self._stats[2]
 
     def getZombieCount(self):
-        return self.__getFilled(self.zombieDir)
-
-    def __getFilled(self, countDir):
-        if countDir < 0:
-            return np.sum(self.grid < 0)
-        if countDir > 0:
-            return np.sum(self.grid > 0)
-        return np.sum(self.grid == 0)
-
-    def __getPopulation(self, countDir):
-        if countDir < 0:
-            return abs(np.sum(self.grid[self.grid < 0]))
-        else:
-            return abs(np.sum(self.grid[self.grid > 0]))
+        return self._stats[3]
+
+    def getEmptyCount(self):
+        return self.grid.size - self._stats[2] - self._stats[3]
 
     def isApocalypse(self, atoi=1e-3):
         return np.isclose(self.getHumanPopulation(),0,atol=atoi) or np.isclose(self.getZombiePopulation(),0,atol=atoi)
@@ -0,0 +1,139 @@
+import os
+import glob
+import queue
+import threading
+import numpy as np
+from simgrid import SimGrid
+from solve_rk import Solver
+
+# Checkpoint/restart of a run and a chunked, compressed on-disk history of its grids
+
+def saveCheckpoint(path, grid, solver=None):
+    """ Writes grid (and solver) state to a single .npz, replaced atomically so a crash never leaves half a checkpoint """
+    arrays = {f"grid_{key}": value for key, value in grid.getState().items()}
+    if solver is not None:
+        arrays.update({f"solver_{key}": value for key, value in solver.getState().items()})
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmpPath, path)
+
+def loadCheckpoint(path, memmapDir=None):
+    """ Returns (grid, solver), solver is None if the checkpoint didn't have one """
+    with np.load(path) as data:
+        gridState = {key[len("grid_"):]: data[key] for key in data.files if key.startswith("grid_")}
+        solverState = {key[len("solver_"):]: data[key] for key in data.files if key.startswith("solver_")}
+    grid = SimGrid.fromState(gridState, memmapDir=memmapDir)
+    solver = Solver.fromState(solverState) if solverState else None
+    return grid, solver
+
+
+class SnapshotWriter:
+    """ Records every k-th grid into chunks of chunkSize grids, each written as directory/chunk_<n>.npz by a background
+    thread. At most maxPending full chunks wait for the writer, after that record() blocks, so memory stays bounded """
+    def __init__(self, directory, every=1, chunkSize=64, maxPending=2):
+        self.directory = directory
+        self.every = every
+        self.chunkSize = chunkSize
+        os.makedirs(directory, exist_ok=True)
+
+        self._calls = 0
+        self._chunkIndex = 0
+        self._chunk = None
+        self._times = np.empty(chunkSize)
+        self._steps = np.empty(chunkSize, dtype=np.int64)
+        self._count = 0
+
+        self._queue = queue.Queue(maxPending)
+        self._error = None
+        self._thread = threading.Thread(target=self._writeLoop, daemon=True)
+        self._thread.start()
+
+    def _writeLoop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            path, arrays = job
+            try:
+                with open(path + ".tmp", "wb") as f:
+                    np.savez_compressed(f, **arrays)
+                os.replace(path + ".tmp", path)
+            except Exception as e:  # handed back to the sim thread on the next record/close
+                self._error = e
+
+    def _checkError(self):
+        if self._error is not None:
+            raise RuntimeError("Snapshot writer failed") from self._error
+
+    def record(self, grid):
+        """ Call after every propagate, copies the grid if this is a k-th call """
+        self._checkError()
+        self._calls += 1
+        if (self._calls - 1) % self.every:
+            return
+        if self._chunk is None:
+            self._chunk = np.empty((self.chunkSize,) + grid.grid.shape, dtype=grid.grid.dtype)
+        self._chunk[self._count] = grid.grid
+        self._times[self._count] = grid.timePassed
+        self._steps[self._count] = grid.stepCount
+        self._count += 1
+        if self._count == self.chunkSize:
+            self._flushChunk()
+
+    def _flushChunk(self):
+        if self._count == 0:
+            return
+        path = os.path.join(self.directory, f"chunk_{self._chunkIndex:06d}.npz")
+        # the writer gets these arrays for itself, recording continues into a fresh chunk
+        arrays = {"grids": self._chunk[:self._count], "times": self._times[:self._count].copy(), "steps": self._steps[:self._count].copy()}
+        self._queue.put((path, arrays))
+        self._chunk = None
+        self._count = 0
+        self._chunkIndex += 1
+
+    def close(self):
+        """ Writes the last partial chunk and waits for the writer to finish """
+        self._flushChunk()
+        self._queue.put(None)
+        self._thread.join()
+        self._checkError()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SnapshotReader:
+    """ Random access over the grids a SnapshotWriter wrote, one chunk is loaded at a time """
+    def __init__(self, directory):
+        self.paths = sorted(glob.glob(os.path.join(directory, "chunk_*.npz")))
+        times, steps, self._chunkStarts = [], [], [0]
+        for path in self.paths:
+            with np.load(path) as data:
+                times.append(data["times"])
+                steps.append(data["steps"])
+            self._chunkStarts.append(self._chunkStarts[-1] + len(times[-1]))
+        self.times = np.concatenate(times) if times else np.empty(0)
+        self.steps = np.concatenate(steps) if steps else np.empty(0, dtype=np.int64)
+        self._cached = (-1, None)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        chunk = int(np.searchsorted(self._chunkStarts, i, side="right")) - 1
+        if self._cached[0] != chunk:
+            with np.load(self.paths[chunk]) as data:
+                self._cached = (chunk, data["grids"])
+        return self._cached[1][i - self._chunkStarts[chunk]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -1,105 +1,142 @@
+import json
 import numpy as np
-from scipy.integrate import solve_ivp
+import odeNjits
+from profiling import profiler
 
 class Solver:
-    def __init__(self, populationSize, z0, infectionGrowth, zombieLoss, humanLoss, block_size=2, t_scalar=5):
+    GROWTH = 64  # initial node capacity, doubled when full
+
+    def __init__(self, populationSize, z0, infectionGrowth, zombieLoss, humanLoss, block_size=2, t_scalar=5, rtol=1e-3, atol=1e-6):
         self.h0 = populationSize - z0  # Initial human population
         self.z0 = z0  # Initial zombie population
-        self.infectionGrowth = infectionGrowth  # Infection rate
-        self.humanLoss = humanLoss  # Additional loss term for humans
-        self.zombieLoss = zombieLoss  # Recovery rate (should be applied to Z, not H)
-        self.block_size = block_size  # Time block size
+        # rates are kept as floats so the compiled integrator only ever sees one signature
+        self.infectionGrowth = float(infectionGrowth)  # Infection rate
+        self.humanLoss = float(humanLoss)  # Additional loss term for humans
+        self.zombieLoss = float(zombieLoss)  # Recovery rate (should be applied to Z, not H)
+        self.block_size = block_size  # Integration is extended at least this far past a requested time
         self.total_population = populationSize  # Assume constant total
         self.interactionScale = 1 / self.total_population
         self.t_scalar = t_scalar
-
-        self.blocks = {}  # Cache for computed time blocks
-        self.last_block_start = None  # Track the start time of the last computed block
-
-    def _model(self, t, y):
-        """Differential equations for H and Z."""
-        H, Z = y
-        H, Z = y
-        scaled_interaction = self.interactionScale * H * Z
-        dHdt = np.clip(-self.infectionGrowth * scaled_interaction - self.humanLoss * Z * self.interactionScale,-H,Z)
-        dZdt = np.clip(self.infectionGrowth * scaled_interaction - self.zombieLoss * H * self.interactionScale,-Z,H)
-
-        return [dHdt, dZdt]
-
-    def _solve_block(self, start_t):
-        """Solve the system from start_t to start_t + block_size and store it."""
-        if start_t in self.blocks:
-            return  # Block already solved
-
-        # Use correct initial values
-        if start_t == 0:
-            initial_values = [self.h0, self.z0]
-        else:
-            previous_block = start_t - self.block_size
-            if previous_block in self.blocks:
-                initial_values = self.blocks[previous_block].y[:, -1]
-            else:
-                print(f"Warning: Missing previous block at {previous_block}, using initial values.")
-                initial_values = [self.h0, self.z0]  # Fallback
-
-        t_span = (start_t, start_t + self.block_size)
-        t_eval = np.linspace(*t_span, num=20)
-
-        sol = solve_ivp(self._model, t_span, initial_values, t_eval=t_eval, method="RK45")
-        self.blocks[start_t] = sol
-        self.last_block_start = start_t
-
-    def _get_nearest_value(self, sol, t):
-        """Find the nearest computed value in a solved block."""
-        idx = np.abs(sol.t - t).argmin()
-        return sol.y[:, idx]
-
-    def _ensure_block(self, t):
-        """Ensure that the block containing time t is solved."""
-        # Align t to the block start time
-        blocked_t = (t // self.block_size) * self.block_size
-        # If no blocks computed yet, start with block 0
-        if self.last_block_start is None:
-            self._solve_block(0)
-        # Compute blocks sequentially until we have the block that covers t
-        while blocked_t not in self.blocks:
-            # Determine the start time for the next block
-            if self.last_block_start is None:
-                next_start = 0
-            else:
-                next_start = self.last_block_start + self.block_size
-            self._solve_block(next_start)
-        return blocked_t
+        self.rtol = float(rtol)
+        self.atol = float(atol)
+
+        # Accepted integrator nodes (time, [H, Z], [dH/dt, dZ/dt]), values between them come from Hermite interpolation
+        self._ts = np.empty(self.GROWTH)
+        self._ys = np.empty((self.GROWTH, 2))
+        self._fs = np.empty((self.GROWTH, 2))
+        self._ts[0] = 0
+        self._ys[0] = self.h0, self.z0
+        self._fs[0] = odeNjits.model(float(self.h0), float(self.z0), self.infectionGrowth, self.zombieLoss, self.humanLoss, self.interactionScale)
+        self._count = 1
+        self._nextStep = 0.0  # let the integrator pick the first step
+        self.extensions = 0  # how many times the integration had to be extended
+
+    def getState(self):
+        """Parameters and integrator nodes as a dict of arrays, fromState() continues from exactly here."""
+        params = {"populationSize": self.total_population, "z0": self.z0, "infectionGrowth": self.infectionGrowth,
+                  "zombieLoss": self.zombieLoss, "humanLoss": self.humanLoss, "block_size": self.block_size,
+                  "t_scalar": self.t_scalar, "rtol": self.rtol, "atol": self.atol}
+        return {"params": np.array(json.dumps(params, default=int)), "ts": self._ts[:self._count], "ys": self._ys[:self._count],
+                "fs": self._fs[:self._count], "nextStep": np.array(self._nextStep), "extensions": np.array(self.extensions)}
+
+    @classmethod
+    def fromState(cls, state):
+        solver = cls(**json.loads(str(state["params"])))
+        solver._count = len(state["ts"])
+        solver._ts = np.array(state["ts"], dtype=np.float64)
+        solver._ys = np.array(state["ys"], dtype=np.float64)
+        solver._fs = np.array(state["fs"], dtype=np.float64)
+        solver._nextStep = float(state["nextStep"])
+        solver.extensions = int(state["extensions"])
+        return solver
+
+    def _extend(self, t):
+        """Integrate from the last node until at least t (in solver time)."""
+        last = self._ts[self._count - 1]
+        if t <= last:
+            return
+        H, Z = self._ys[self._count - 1]
+        with profiler.phase("solver_extend"):
+            ts, ys, fs, self._nextStep = odeNjits.integrate(last, H, Z, t + self.block_size, self._nextStep, self.infectionGrowth,
+                                                            self.zombieLoss, self.humanLoss, self.interactionScale, self.rtol, self.atol)
+        profiler.count("solver_blocks")
+        needed = self._count + len(ts)
+        if needed > len(self._ts):
+            profiler.count("allocations")
+            capacity = max(needed, 2 * len(self._ts))
+            self._ts = np.resize(self._ts, capacity)
+            self._ys = np.resize(self._ys, (capacity, 2))
+            self._fs = np.resize(self._fs, (capacity, 2))
+        self._ts[self._count:needed] = ts
+        self._ys[self._count:needed] = ys
+        self._fs[self._count:needed] = fs
+        self._count = needed
+        self.extensions += 1
+
+    def _valueAt(self, t):
+        """(H, Z) at simulation time t."""
+        t = max(t / self.t_scalar, 0)
+        self._extend(t)
+        return odeNjits.denseValue(self._ts, self._ys, self._fs, self._count, t)
 
     def getHumanPopulation(self, t):
-        """Return H(t), computing new blocks if needed."""
-        t = t/self.t_scalar
-        blocked_t = self._ensure_block(t)
-        return self._get_nearest_value(self.blocks[blocked_t], t)[0]
-    
+        """Return H(t), integrating further if needed."""
+        return self._valueAt(t)[0]
 
     def getZombiePopulation(self, t):
-        """Return Z(t), computing new blocks if needed."""
-        t = t/self.t_scalar
-        blocked_t = self._ensure_block(t)
-        return self._get_nearest_value(self.blocks[blocked_t], t)[1]
+        """Return Z(t), integrating further if needed."""
+        return self._valueAt(t)[1]
 
     def getRecoveredPopulation(self, t):
         """Return recovered population R(t)."""
-        h = self.getHumanPopulation(t)
-        z = self.getZombiePopulation(t)
-        if h is not None and z is not None:
-            return self.total_population - h - z
-        return None
+        h, z = self._valueAt(t)
+        return self.total_population - h - z
+
+    def getPopulations(self, t):
+        """Return (H, Z, R) for a time or an array of times in one pass."""
+        scalar = np.ndim(t) == 0
+        times = np.maximum(np.asarray(t, dtype=np.float64).ravel() / self.t_scalar, 0)
+        if times.size:  # nothing to extend to for an empty array of times
+            self._extend(times.max())
+        values = odeNjits.denseValues(self._ts, self._ys, self._fs, self._count, times)
+        h, z = values[:, 0], values[:, 1]
+        if scalar:
+            return h[0], z[0], self.total_population - h[0] - z[0]
+        shape = np.shape(t)
+        return h.reshape(shape), z.reshape(shape), (self.total_population - h - z).reshape(shape)
+
+    def getExtinctionTime(self, atol=1e-3, maxTime=50000):
+        """Return the first time humans or zombies are extinct, None if it doesn't happen before maxTime."""
+        maxSolverTime = maxTime / self.t_scalar
+        while True:
+            extinct = odeNjits.extinctionTime(self._ts, self._ys, self._fs, self._count, atol)
+            if extinct >= 0:
+                return extinct * self.t_scalar if extinct <= maxSolverTime else None
+            last = self._ts[self._count - 1]
+            if last >= maxSolverTime:
+                return None
+            self._extend(min(2 * last + self.block_size, maxSolverTime))
 
     def isApocalypse(self, t, atol=1e-3):
         """Check if humans or zombies are extinct at time t."""
-        h = self.getHumanPopulation(t)
-        z = self.getZombiePopulation(t)
-        if h is None or z is None:
-            return False
+        h, z = self._valueAt(t)
         return np.isclose(h, 0, atol=atol) or np.isclose(z, 0, atol=atol)
 
+def solveBatch(populationSizes, z0s, infectionGrowths, zombieLosses, humanLosses, times, t_scalar=5, rtol=1e-3, atol=1e-6):
+    """Solve many parameter sets at once (arguments broadcast against each other) at the given simulation times.
+    Returns an (n_params, n_times, 3) array of (H, Z, R)."""
+    params = np.broadcast_arrays(*(np.atleast_1d(np.asarray(p, dtype=np.float64)) for p in
+                                   (populationSizes, z0s, infectionGrowths, zombieLosses, humanLosses)))
+    populationSizes, z0s, infectionGrowths, zombieLosses, humanLosses = (np.ascontiguousarray(p) for p in params)
+    times = np.maximum(np.asarray(times, dtype=np.float64).ravel() / t_scalar, 0)
+    order = np.argsort(times, kind="stable")
+
+    hz = odeNjits.integrateBatch(populationSizes, z0s, infectionGrowths, zombieLosses, humanLosses, times[order], rtol, atol)
+    result = np.empty((len(populationSizes), len(times), 3))
+    result[:, order, :2] = hz
+    result[:, :, 2] = populationSizes[:, None] - result[:, :, 0] - result[:, :, 1]
+    return result
+
 if __name__ == "__main__":
     solver = Solver(1000, 1, 0.3, 0, 0)
     print("Solving IVP...")
@@ -0,0 +1,150 @@
+import os
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numba
+import numpy as np
+import simNjits
+from profiling import profiler
+from simgrid import SimGrid
+
+# SimGrid split into stripes of rows, each stepped by its own worker process. All buffers live in shared memory, so the
+# halo rows a stripe needs from its neighbours are read straight from them, and movement into a neighbouring stripe is
+# ordered by the same row colouring the threaded kernel uses (a barrier after every colour). The cells, random streams
+# and the order of every sum are the same as in SimGrid, so a tiled run matches the monolithic one exactly
+
+STOP, STEP = 0, 1
+BUFFERS = ("grid_a", "grid_b", "updated")
+
+
+def _attach(name, shape, dtype):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def _worker(rowStart, rowEnd, names, shape, dtype, params, command, startBarrier, stepBarrier, threads):
+    numba.set_num_threads(threads)
+    memories, arrays = zip(*(_attach(name, shape, dtype) for name in names[:3]))
+    statsMemory, rowStats = _attach(names[3], (shape[0], 4), np.float64)
+    zombieDir, humanDir, maxStepSize, periodic, seed = params
+    tail = simNjits.movementRowsColoured(shape[0], periodic) < shape[0]
+    lastWorker = rowEnd == shape[0]
+    grid = backGrid = updatedGrid = None
+
+    while True:
+        startBarrier.wait()
+        if command[0] == STOP:
+            break
+        timeStep, step, current = command[1], int(command[2]), int(command[3])
+        infectionGrowth, zombieLoss, humanLoss, moveProb = command[4:8]  # sent every step so the setters work like on SimGrid
+        grid, backGrid, updatedGrid = arrays[current], arrays[1 - current], arrays[2]
+        while timeStep > 0:
+            smallStep = min(timeStep, maxStepSize)
+            timeStep -= maxStepSize
+            simNjits.interactionRows(grid, backGrid, updatedGrid, rowStart, rowEnd, smallStep, infectionGrowth, zombieLoss, humanLoss,
+                                     zombieDir, humanDir, periodic, seed, step)
+            stepBarrier.wait()  # every updated row (this stripe's halo included) is ready
+            for colour in range(3):
+                simNjits.movementRows(updatedGrid, backGrid, rowStart, rowEnd, colour, zombieDir, humanDir, moveProb, periodic, seed, step)
+                stepBarrier.wait()  # writes into the neighbouring stripes are done before the next colour starts
+            if tail:
+                if lastWorker:
+                    simNjits.movementTailRows(updatedGrid, backGrid, zombieDir, humanDir, moveProb, periodic, seed, step)
+                stepBarrier.wait()
+            grid, backGrid = backGrid, grid
+            step += 1
+        simNjits.rowStatsInto(grid, rowStats, rowStart, rowEnd)
+        startBarrier.wait()  # tell the main process this step is done
+
+    del arrays, grid, backGrid, updatedGrid, rowStats  # the memory can't be closed while arrays still point into it
+    for memory in memories + (statsMemory,):
+        memory.close()
+
+
+class TiledSimGrid(SimGrid):
+    """ SimGrid whose steps are run by worker processes, each owning a stripe of rows (default: one per core).
+    Call close() (or use it as a context manager) to stop the workers and free the shared memory """
+    def __init__(self, populationSize, z0, infectionGrowth, zombieLoss, humanLoss, gridCellCount=1000, moveProb=0.05, periodic=False, seed=None,
+                 dtype=np.float64, workers=None, threadsPerWorker=1, **gridOptions):
+        if gridOptions.get("sparse") or gridOptions.get("memmapDir") or gridOptions.get("adaptive") or gridOptions.get("backend") == "numpy":
+            raise ValueError("TiledSimGrid keeps dense grids in shared memory and takes fixed steps with the numba kernels, "
+                             "sparse, memmapDir, adaptive and the numpy backend are not supported")
+        self._shared = {}
+        super().__init__(populationSize, z0, infectionGrowth, zombieLoss, humanLoss, gridCellCount, moveProb, periodic, seed,
+                         dtype=dtype, **gridOptions)
+        statsMemory = shared_memory.SharedMemory(create=True, size=self.squareSize * 4 * 8)
+        self._shared["stats"] = statsMemory
+        self._rowStats = np.ndarray((self.squareSize, 4), dtype=np.float64, buffer=statsMemory.buf)
+        self._current = 0  # which of grid_a/grid_b holds the grid
+
+        workers = min(workers or os.cpu_count(), self.squareSize)
+        bounds = np.linspace(0, self.squareSize, workers + 1).astype(int)
+        context = mp.get_context("spawn")  # fork and numba's threads don't mix
+        self._command = context.RawArray("d", 8)  # command, timeStep, step, buffer, infectionGrowth, zombieLoss, humanLoss, moveProb
+        self._startBarrier = context.Barrier(workers + 1)
+        self._stepBarrier = context.Barrier(workers)  # kept here too, the workers can only attach while it exists
+        names = [self._shared[name].name for name in BUFFERS + ("stats",)]
+        params = (self.zombieDir, self.humanDir, self.MAXSTEPSIZE, self.periodic, self._kernelSeed)
+        self._workers = [context.Process(target=_worker, args=(int(bounds[i]), int(bounds[i + 1]), names, self.grid.shape, self.dtype, params,
+                                                               self._command, self._startBarrier, self._stepBarrier, threadsPerWorker), daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _allocateGrid(self, name, dtype=None):
+        """ Zeroed buffers in shared memory so the workers can attach to them """
+        dtype = np.dtype(self.dtype if dtype is None else dtype)
+        shape = (self.squareSize, self.squareSize)
+        memory = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+        self._shared[name] = memory
+        array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+        array[...] = 0
+        return array
+
+    def propagate(self, timeStep=1):
+        """ Same as SimGrid.propagate, run by the workers """
+        self.timePassed += timeStep
+        self._command[:] = (STEP, float(timeStep), self.stepCount, self._current, float(self.infectionGrowth), float(self.zombieLoss),
+                            float(self.humanLoss), float(self.moveProb))
+        with profiler.phase("step"):
+            self._startBarrier.wait()
+            self._startBarrier.wait()  # the workers are done
+
+        substeps = 0
+        while timeStep > 0:
+            timeStep -= self.MAXSTEPSIZE
+            substeps += 1
+        self.stepCount += substeps
+        self.lastSubsteps = substeps
+        profiler.count("substeps", substeps)
+        profiler.count("cells_visited", self.grid.size * substeps)
+        if substeps % 2:
+            self.grid, self._backGrid = self._backGrid, self.grid
+            self._current = 1 - self._current
+        stats = self._rowStats.sum(axis=0)
+        self._stats = (stats[0], stats[1], int(stats[2]), int(stats[3]))
+
+    def runUntil(self, *args, **kwargs):
+        """ SimGrid.runUntil in this process on the shared buffers, same results, the workers sit it out """
+        stepCount = self.stepCount
+        result = super().runUntil(*args, **kwargs)
+        self._current ^= (self.stepCount - stepCount) % 2
+        return result
+
+    def close(self):
+        if getattr(self, "_workers", None):
+            self._command[0] = STOP
+            self._startBarrier.wait()
+            for worker in self._workers:
+                worker.join()
+            self._workers = []
+        self.grid = self._backGrid = self._updatedGrid = self._rowStats = None  # nothing may point into the memory anymore
+        for memory in self._shared.values():
+            memory.close()
+            memory.unlink()
+        self._shared = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
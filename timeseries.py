@@ -0,0 +1,130 @@
+import threading
+import numpy as np
+
+class RingBuffer:
+    """ Fixed capacity (capacity, width) float array that overwrites its oldest rows once full """
+    def __init__(self, capacity, width):
+        self.data = np.empty((capacity, width), dtype=np.float64)
+        self.capacity = capacity
+        self.start = 0  # row index of the oldest row
+        self.count = 0  # rows currently held
+        self.total = 0  # rows ever appended
+
+    def append(self, row):
+        end = (self.start + self.count) % self.capacity
+        self.data[end] = row
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+        self.total += 1
+
+    def last(self):
+        return self.data[(self.start + self.count - 1) % self.capacity]
+
+    def overflowed(self):
+        return self.total > self.capacity
+
+    def view(self):
+        """ Held rows oldest first, a view when they don't wrap around """
+        end = self.start + self.count
+        if end <= self.capacity:
+            return self.data[self.start:end]
+        return np.concatenate((self.data[self.start:], self.data[:end - self.capacity]))
+
+    def clear(self):
+        self.start = self.count = self.total = 0
+
+
+class TimeSeriesStore:
+    """ Bounded store for several series sampled at the same times.
+    The newest capacity samples are kept at full resolution in a ring buffer, and every level l of the pyramid keeps the
+    min/max envelope of buckets of factor**l samples, so the whole history can be drawn with a bounded number of points """
+    def __init__(self, names, capacity=2048, factor=4, levels=10):
+        self.names = list(names)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.factor = factor
+        width = len(self.names)
+
+        self._raw = RingBuffer(capacity, 1 + width)  # time, values...
+        # level l (1..levels) rows: bucket start time, bucket end time, mins..., maxs...
+        self._levels = [RingBuffer(capacity, 2 + 2 * width) for _ in range(levels)]
+        self._bucketSizes = factor ** np.arange(1, levels + 1)
+
+        # the bucket every level is currently filling, updated for all levels at once on every append
+        self._accStart = np.zeros(levels)
+        self._accMin = np.full((levels, width), np.inf)
+        self._accMax = np.full((levels, width), -np.inf)
+        self._accCount = np.zeros(levels, dtype=np.int64)
+        self._lock = threading.Lock()  # appended to from the sim thread, read from the GUI thread
+
+    def __len__(self):
+        return self._raw.total
+
+    def append(self, t, values):
+        """ Add one sample, values in the order of names """
+        values = np.asarray(values, dtype=np.float64)
+        with self._lock:
+            self._raw.append(np.concatenate(((t,), values)))
+
+            self._accStart[self._accCount == 0] = t
+            np.minimum(self._accMin, values, out=self._accMin)
+            np.maximum(self._accMax, values, out=self._accMax)
+            self._accCount += 1
+
+            for level in np.flatnonzero(self._accCount == self._bucketSizes):
+                self._levels[level].append(np.concatenate(((self._accStart[level], t), self._accMin[level], self._accMax[level])))
+                self._accMin[level] = np.inf
+                self._accMax[level] = -np.inf
+                self._accCount[level] = 0
+
+    def latest(self):
+        """ (time, values) of the newest sample """
+        with self._lock:
+            row = self._raw.last()
+            return row[0], row[1:].copy()
+
+    def getRaw(self, name):
+        """ Times and values still held at full resolution """
+        with self._lock:
+            rows = self._raw.view()
+            return rows[:, 0].copy(), rows[:, 1 + self._index[name]].copy()
+
+    def getPlotData(self, name, maxPoints=2000):
+        """ At most about maxPoints (time, value) points covering the whole history of a series.
+        Raw samples if they fit, otherwise the min/max envelope of the finest level that does """
+        column = self._index[name]
+        width = len(self.names)
+        with self._lock:
+            if self._raw.count <= maxPoints and not self._raw.overflowed():
+                rows = self._raw.view()
+                return rows[:, 0].copy(), rows[:, 1 + column].copy()
+
+            for level, buckets in enumerate(self._levels):
+                partial = self._accCount[level] > 0
+                if (buckets.count + partial) * 2 <= maxPoints and not buckets.overflowed():
+                    break
+            rows = buckets.view()
+            starts, ends = rows[:, 0], rows[:, 1]
+            mins, maxs = rows[:, 2 + column], rows[:, 2 + width + column]
+            if partial:
+                starts = np.append(starts, self._accStart[level])
+                ends = np.append(ends, self._raw.last()[0])
+                mins = np.append(mins, self._accMin[level, column])
+                maxs = np.append(maxs, self._accMax[level, column])
+
+            # every bucket becomes two points, its min at its start and its max at its end, so the line keeps the envelope
+            times = np.empty(2 * len(starts))
+            times[0::2], times[1::2] = starts, ends
+            values = np.empty(2 * len(starts))
+            values[0::2], values[1::2] = mins, maxs
+            return times, values
+
+    def clear(self):
+        with self._lock:
+            self._raw.clear()
+            for buckets in self._levels:
+                buckets.clear()
+            self._accMin[:] = np.inf
+            self._accMax[:] = -np.inf
+            self._accCount[:] = 0
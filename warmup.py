@@ -0,0 +1,24 @@
+import threading
+import numpy as np
+from simgrid import SimGrid
+from solve_rk import Solver
+
+# The kernels are cached on disk by numba (cache=True), so only the very first run compiles them. Running everything
+# once on tiny inputs loads (or compiles) them up front, in a background thread if there is something else to do meanwhile
+
+def warmup(sparse=True):
+    """ Runs SimGrid and Solver once on tiny inputs so their kernels are ready """
+    for useSparse in ((False, True) if sparse else (False,)):
+        grid = SimGrid(20, 2, 0.1, 0.05, 0.0, 16, seed=0, sparse=useSparse)
+        grid.propagate(1)
+    solver = Solver(20, 2, 0.1, 0.05, 0.0)
+    solver.getPopulations(1.0)
+    solver.getPopulations(np.array([1.0, 2.0]))
+    solver.isApocalypse(1.0)
+    solver.getExtinctionTime(maxTime=10)
+
+def startWarmup(sparse=True):
+    """ warmup() in a daemon thread, returns the thread. Kernel calls made meanwhile just wait for it """
+    thread = threading.Thread(target=warmup, args=(sparse,), daemon=True)
+    thread.start()
+    return thread